@@ -11,11 +11,13 @@ from SeqAnalysis import SeqAnalysis as seqan
 # target = int(two_month_vol * cvr)
 target = 1000
 ttl = 'CR055 raised prompt test_conversion %'
+cells = ['ctrl', 'test']  # control first, as in FetchData.py
 
-seq = seqan(target, ttl)  # returns the plot!!
+seq = seqan(target, ttl, cells=cells)  # returns the plot!!
 seq.cvr_plot(ttl)
 seq.crossed()
 seq.summary()
+seq.save_state()  # for SeqAnalysis.from_state(...).update(day, counts)
 
 # print(seq.z_score)
 # print(seq.results)
\ No newline at end of file
@@ -5,22 +5,47 @@ Created on Fri Feb  7 16:32:22 2020
 @author: SWannell
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import math
+import numpy as np
 import pandas as pd
 import requests
+import time
+import tracemalloc
 import urllib
 
+API_ROOT = "https://www.googleapis.com/analytics/v3/data/ga"
+
+
+def get_session(workers=1):
+    """Create a requests session with a connection pool of size workers"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 def get_data(gaid, start, end, metrics, dims, token, segment,
-             filters="", max_results=10000):
-    """Create generator to yield GA API data in chunks of size max_results"""
+             filters="", max_results=10000, workers=1, session=None,
+             api_root=API_ROOT):
+    """
+    Create generator to yield GA API data in chunks of size max_results.
+
+    With workers > 1 the first page is used to read totalResults, the
+    remaining start-index offsets are computed up front and fetched in
+    parallel over one pooled session. Pages are still yielded in order.
+    """
     # build uri w/ params
-    api_uri = "https://www.googleapis.com/analytics/v3/data/ga?ids={gaid}" \
+    api_uri = "{api_root}?ids={gaid}" \
               "&start-date={start}&end-date={end}&metrics={metrics}&" \
               "dimensions={dimensions}&segment={segment}&" \
               "samplingLevel=HIGHER_PRECISION&access_token={token}&"\
               "max-results={max_results}"
     # insert uri params
     api_uri = api_uri.format(
+        api_root=api_root,
         gaid=gaid,
         start=start,
         end=end,
@@ -33,33 +58,188 @@ def get_data(gaid, start, end, metrics, dims, token, segment,
     if len(filters) > 0:
         filter_string = "&filters=" + urllib.parse.quote_plus(filters)
         api_uri += filter_string
+    if session is None:
+        session = get_session(workers)
     # Use yield to make a generator bcs memory efficient as data DLed in chunks
-    r = requests.get(api_uri)
+    r = session.get(api_uri)
     data = r.json()
     yield data
-    if data.get("nextLink", None):
+    if workers > 1 and data.get("nextLink"):
+        # offsets are known once we have the total, so no need to chain
+        num_pages = math.ceil(data.get("totalResults", 0) / max_results)
+        page_uris = [api_uri + "&start-index={}".format(1 + i*max_results)
+                     for i in range(1, num_pages)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for data in pool.map(lambda uri: session.get(uri).json(),
+                                 page_uris):
+                yield data
+    elif data.get("nextLink", None):
         while data.get("nextLink"):
             new_uri = data.get("nextLink")
             new_uri += "&access_token={token}".format(token=token)
-            r = requests.get(new_uri)
+            r = session.get(new_uri)
             data = r.json()
             yield data
 
 
-def to_df(gadata):
-    """Takes in a generator from GAData() creates a dataframe from the rows"""
-    df = None
+def plan_shards(start, end, freq='W'):
+    """Split start to end (inclusive) into per-day or per-week date ranges"""
+    days = {'D': 1, 'W': 7}[freq]
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    shards = []
+    while first <= last:
+        shard_end = min(first + pd.Timedelta(days=days-1), last)
+        shards.append((first.strftime('%Y-%m-%d'),
+                       shard_end.strftime('%Y-%m-%d')))
+        first = shard_end + pd.Timedelta(days=1)
+    return shards
+
+
+def _split_shard_(shard):
+    """Halve a date range, or None if it is a single day"""
+    first, last = pd.Timestamp(shard[0]), pd.Timestamp(shard[1])
+    if first == last:
+        return None
+    mid = first + pd.Timedelta(days=((last - first).days - 1) // 2)
+    return [(shard[0], mid.strftime('%Y-%m-%d')),
+            ((mid + pd.Timedelta(days=1)).strftime('%Y-%m-%d'), shard[1])]
+
+
+def get_sharded_data(gaid, start, end, metrics, dims, token, segment,
+                     filters="", max_results=10000, freq='W', workers=4,
+                     session=None, api_root=API_ROOT):
+    """
+    Create generator to yield GA API data for start to end, queried in
+    date shards to keep each request under GA's sampling threshold.
+
+    Shards are fetched concurrently. Any shard whose response has
+    containsSampledData set is split in half and re-fetched, down to single
+    days. Pages are yielded in date order once every shard is unsampled.
+    """
+    if session is None:
+        session = get_session(workers)
+
+    def fetch(shard):
+        return list(get_data(gaid, shard[0], shard[1], metrics, dims, token,
+                             segment, filters=filters,
+                             max_results=max_results, session=session,
+                             api_root=api_root))
+
+    # slots keep the shards in date order as sampled ones are re-split
+    slots = [[shard, None] for shard in plan_shards(start, end, freq)]
+    todo = list(slots)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(todo) > 0:
+            for slot, pages in zip(todo, pool.map(fetch,
+                                                  [s[0] for s in todo])):
+                slot[1] = pages
+            resplit = []
+            for slot in todo:
+                if not slot[1][0].get('containsSampledData'):
+                    continue
+                halves = _split_shard_(slot[0])
+                if halves is None:
+                    print("Shard {} is sampled even for a single day".format(
+                        slot[0][0]))
+                    continue
+                i = slots.index(slot)
+                new = [[half, None] for half in halves]
+                slots[i:i+1] = new
+                resplit += new
+            if len(resplit) > 0:
+                print("Re-splitting {} sampled shards".format(
+                    len(resplit) // 2))
+            todo = resplit
+    for shard, pages in slots:
+        for data in pages:
+            yield data
+
+
+class FrameBuilder:
+    """
+    Build a DataFrame from GA API pages in one pass.
+
+    Each page's rows are converted to typed numpy column buffers as they
+    arrive (dates parsed, metrics made numeric), and the buffers are
+    concatenated once in build(), so the cost is linear in the rows.
+
+    Attributes
+    ----------
+    columns: list
+        Column names, from the first page's columnHeaders.
+    stats: dict
+        Rows, seconds, rows/sec and peak traced memory (MB) of the build.
+    """
+    dtypes = {'INTEGER': 'int64', 'FLOAT': 'float64', 'PERCENT': 'float64',
+              'TIME': 'float64', 'CURRENCY': 'float64'}
+    date_formats = {'ga:date': '%Y%m%d', 'ga:dateHour': '%Y%m%d%H'}
+
+    def __init__(self):
+        self.columns = None
+        self._buffers_ = None
+        self.num_rows = 0
+        self.stats = {}
+
+    def _convert_(self, header, values):
+        """Typed numpy array of one page's values for a column"""
+        if header['name'] in self.date_formats:
+            return pd.to_datetime(values, format=self.date_formats[
+                header['name']]).values
+        dtype = self.dtypes.get(header.get('dataType'), object)
+        return np.array(values, dtype=dtype)
+
+    def add_page(self, data):
+        """Convert a page's rows to column arrays and buffer them"""
+        headers = data['columnHeaders']
+        if self.columns is None:
+            self.columns = [x['name'] for x in headers]
+            self._buffers_ = [[] for _ in headers]
+        rows = data.get('rows', [])
+        if len(rows) == 0:
+            return
+        for header, buffer, values in zip(headers, self._buffers_,
+                                          zip(*rows)):
+            buffer.append(self._convert_(header, values))
+        self.num_rows += len(rows)
+
+    def build(self):
+        """Concatenate the column buffers into the final DataFrame"""
+        if self.columns is None:
+            return None
+        return pd.DataFrame({col: np.concatenate(buffer) if buffer else []
+                             for col, buffer in zip(self.columns,
+                                                    self._buffers_)},
+                            columns=self.columns)
+
+
+def to_df(gadata, report=False):
+    """
+    Takes in a generator from get_data() creates a dataframe from the rows.
+
+    If report, prints rows/sec (including time waiting on gadata) and the
+    peak memory traced while building. Tracing memory slows every
+    allocation, the fetch's included, so it's for benchmarking only. The
+    stats are kept in df.attrs.
+    """
+    builder = FrameBuilder()
+    tracing = report and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    tic = time.perf_counter()
     for data in gadata:
-        if df is None:
-            df = pd.DataFrame(
-                    data['rows'],
-                    columns=[x['name'] for x in data['columnHeaders']]
-                    )
-        else:
-            newdf = pd.DataFrame(
-                    data['rows'],
-                    columns=[x['name'] for x in data['columnHeaders']]
-                    )
-            df = df.append(newdf)
-        print("Gathered {} rows".format(len(df)))
-    return df
\ No newline at end of file
+        builder.add_page(data)
+        print("Gathered {} rows".format(builder.num_rows))
+    df = builder.build()
+    secs = time.perf_counter() - tic
+    builder.stats = {'rows': builder.num_rows, 'seconds': secs,
+                     'rows_per_sec': builder.num_rows / secs if secs else 0}
+    if report:
+        builder.stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        if tracing:
+            tracemalloc.stop()
+        print("Built {rows} rows in {seconds:.2f}s ({rows_per_sec:,.0f} "
+              "rows/sec), peak memory {peak_mb:.1f} MB".format(
+                  **builder.stats))
+    if df is not None:
+        df.attrs['build_stats'] = builder.stats
+    return df
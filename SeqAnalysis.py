@@ -5,60 +5,276 @@ Created on Fri Jan 17 15:19:39 2020
 @author: SWannell
 """
 
+from itertools import combinations
+import json
 import numpy as np
-from scipy.stats import norm
-import matplotlib.pyplot as plt; plt.style.use('ggplot')
-import matplotlib.ticker as mtick
+from scipy.stats import norm, t
 import pandas as pd
 
 
+def _pyplot_():
+    """Import pyplot on first use, so compute-only runs never load it"""
+    import matplotlib.pyplot as plt
+    plt.style.use('ggplot')
+    return plt
+
+
+def obf_boundary(info_q, boundary_param):
+    """
+    Calculate z-score decision boundary values, using a Lan-Demets spending
+    function of O'Brien-Fleming type. Vectorised over info_q of any shape.
+    Uses sf/isf rather than 1-cdf/ppf, which lose all precision once the
+    p-value limit drops below ~1e-15 (q below about 0.07 at alpha=0.05).
+
+    Parameters
+    ----------
+    info_q : float, np.array
+        The information quotient. All values should be between 0 and 1.
+    boundary_param : float
+        Could be alpha (e.g. 0.05) or beta (e.g. 0.8).
+
+    Returns
+    -------
+    f_z : np.array
+        z-score boundary values, same shape as info_q.
+    """
+    z = norm.isf(boundary_param/2)
+    arg = z/np.sqrt(info_q)
+    f = 2*norm.sf(arg)  # gives the p-value limit line
+    f_z = norm.isf(f)  # gives the Z-value limit line
+    return f_z
+
+
+def obf_t_boundary(info_q, boundary_param, degf):
+    """
+    The obf_boundary values converted to t-scores, via their p-values.
+
+    Parameters
+    ----------
+    info_q : float, np.array
+        The information quotient.
+    boundary_param : float
+        Could be alpha (e.g. 0.05) or beta (e.g. 0.8).
+    degf : float, np.array
+        Degrees of freedom. Broadcasts against info_q.
+
+    Returns
+    -------
+    f_t : np.array
+        t-score boundary values.
+    """
+    z = norm.isf(boundary_param/2)
+    f = 2*norm.sf(z/np.sqrt(info_q))  # gives the p-value limit line
+    return t.isf(f, degf)
+
+
+def pairwise_z(n, conv, pairs):
+    """
+    z-scores of cell b vs cell a conversion rate, for every (a, b) pair at
+    once. Broadcast over any trailing axes, e.g. days.
+
+    Parameters
+    ----------
+    n, conv : np.array
+        Cumulative users and conversions, shape (cells, ...).
+    pairs : np.array
+        Cell index pairs (a, b), shape (comparisons, 2).
+
+    Returns
+    -------
+    z : np.array
+        Shape (comparisons, ...).
+    """
+    n, conv = np.asarray(n, dtype=float), np.asarray(conv, dtype=float)
+    a, b = np.asarray(pairs)[:, 0], np.asarray(pairs)[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ctr = conv / n
+        var = ctr*(1-ctr)/n
+        return (ctr[b] - ctr[a]) / np.sqrt(var[a] + var[b])
+
+
+palette = ['#1d1a1c', '#ee2a24', '#1f78b4', '#33a02c', '#ff7f00', '#6a3d9a']
+
+
 class SeqAnalysis:
     """
     Perform and visualise sequential analysis on split test data.
 
+    The first cell is the control. Each other cell is compared with it (or
+    every pair of cells, with all_pairs), and the efficacy boundary uses a
+    Bonferroni-adjusted alpha: alpha / number of comparisons. The target is
+    per comparison, so the information quotient q is the conversions over
+    all cells / (target * cells / 2): each pair's q, if cells convert alike.
+
     ...
 
     Attributes
     ----------
+    cells: list
+        Cell names, control first.
+    comparisons: list
+        (a, b) cell name pairs, each tested as b vs a.
+    alpha_adj: float
+        alpha / len(comparisons), used for the efficacy boundary.
     z_score: pd.DataFrame
         The cumulative conversions, z-score, and information quotient q by day.
+        With more than one comparison, one 'z_{b}_vs_{a}' column each.
     results: dict
         The cumulative n, conversions, conversion rate, and variance.
         One entry per test cell.
     daily_results: pd.DataFrame
         The daily n, conversions, conversion rate, and variance - by cell.
-    figbdr, axbdr: plt items for boundary plot
-    figcvr, axcvr: plt items for conversion rate plot
+    state: dict
+        Running n and conversions per cell, and the (day, q, z) history.
+        Kept up to date by update(); z_score and results are as loaded.
+    figbdr, axbdr: plt items for boundary plot, set by plot()
+    figcvr, axcvr: plt items for conversion rate plot, set by cvr_plot()
     """
     def __init__(self, target, ttl, data_fp='AmendedData\\CumuData{}.pkl',
                  graph_fp='Outputs\\Results_Target{}.png',
-                 alpha=0.05, beta=0.2):
+                 alpha=0.05, beta=0.2, plot=True, cells=('ctrl', 'test'),
+                 all_pairs=False):
         """
         Initiates the sequential analysis object.
 
         Parameters
         ----------
         target : int
-            The target conversion volume.
+            The target conversion volume of each comparison: conversions
+            over the two cells compared.
         ttl : string
             The title of the boundary graph.
         data_fp : string
             File path of the .pkl data files. One per cell.
         graph_fp : string
             Destination file path of the boundary graph with z_score line.
+        plot : bool
+            Draw, save and show the boundary graph now. If False nothing
+            touches matplotlib until plot() or cvr_plot() is called.
+        cells : list
+            Cell names, control first, as in the CumuData{cell}.pkl files.
+        all_pairs : bool
+            Compare every pair of cells, not just each cell vs control.
         """
-        self.figbdr, self.axbdr = plt.subplots(1, 1, figsize=(7, 7))
-        self.q = np.linspace(0.06, 1, 30)  # information quotient
+        self._setup_(target, ttl, graph_fp, alpha, beta, cells, all_pairs)
         self.z_score = self.z_score(target, data_fp)
-        self.bdry_plot(alpha, beta)
-        self.z_plot(target, ttl, graph_fp)
-        self._titledict_ = {'fontsize': 16, 'fontweight': 'bold'}
+        self.state = {
+            'target': target,
+            'all_pairs': all_pairs,
+            'cells': {cell: {var: float(res['by_day'][var].iloc[-1])
+                             for var in ['n', 'conv']}
+                      for cell, res in self.results.items()},
+            'history': [[day.strftime('%Y-%m-%d'), float(row['q']),
+                         self._z_entry_(row[self._z_cols_].values)]
+                        for day, row in self.z_score.iterrows()]}
+        if plot:
+            self.plot()
+
+    def _setup_(self, target, ttl, graph_fp, alpha, beta, cells, all_pairs):
+        self.target, self.ttl, self.graph_fp = target, ttl, graph_fp
+        # conversions over all cells when each pair reaches target
+        self._total_target_ = target * len(cells) / 2
         self.alpha, self.beta = alpha, beta
+        self._titledict_ = {'fontsize': 16, 'fontweight': 'bold'}
+        self.q = np.linspace(0.06, 1, 30)  # information quotient
+        self.cells = list(cells)
+        if all_pairs:
+            self._pairs_ = np.array(list(combinations(range(len(cells)), 2)))
+        else:
+            self._pairs_ = np.array([(0, b) for b in range(1, len(cells))])
+        self.comparisons = [(self.cells[a], self.cells[b])
+                            for a, b in self._pairs_]
+        self.alpha_adj = alpha / len(self.comparisons)
+        if len(self.comparisons) == 1:
+            self._labels_, self._z_cols_ = [''], ['z']
+        else:
+            self._labels_ = ['{}_vs_{}'.format(b, a)
+                             for a, b in self.comparisons]
+            self._z_cols_ = ['z_' + label for label in self._labels_]
+
+    def _z_entry_(self, z):
+        """A history z: a float for one comparison, else a list"""
+        z = [float(x) for x in z]
+        return z[0] if len(z) == 1 else z
+
+    @classmethod
+    def from_state(cls, state_fp='AmendedData\\SeqState.json', ttl='',
+                   graph_fp='Outputs\\Results_Target{}.png',
+                   alpha=0.05, beta=0.2):
+        """
+        Restore a compute-only object from a file written by save_state(),
+        without reading the cumulative data.
+        """
+        self = cls.__new__(cls)
+        with open(state_fp) as f:
+            state = json.load(f)
+        self._setup_(state['target'], ttl, graph_fp, alpha, beta,
+                     list(state['cells']), state.get('all_pairs', False))
+        self.state = state
+        self.results = {cell: {} for cell in state['cells']}
+        self.z_score = self.history()
+        return self
+
+    def save_state(self, state_fp='AmendedData\\SeqState.json'):
+        """Write the running totals and history to a small JSON file"""
+        with open(state_fp, 'w') as f:
+            json.dump(self.state, f)
+
+    def _history_arrays_(self):
+        """Days, q (looks,) and z (looks, comparisons) from the history"""
+        days, qs, zs = zip(*self.state['history'])
+        return (list(days), np.array(qs, dtype=float),
+                np.array(zs, dtype=float).reshape(len(qs), -1))
+
+    def history(self):
+        """The (q, z) history, including updates, as a DataFrame by day"""
+        days, qs, zs = self._history_arrays_()
+        history = pd.DataFrame(zs, columns=self._z_cols_,
+                               index=pd.Index(days, name='day'))
+        history.insert(0, 'q', qs)
+        return history
+
+    def update(self, day, counts, verbose=False):
+        """
+        Add one day's (or hour's) counts to the running state in O(1).
+
+        Parameters
+        ----------
+        day : string
+            Label for the new look, e.g. '2020-06-10'.
+        counts : dict
+            Cell to (n, conv) for the new period only, not cumulative.
+
+        Returns
+        -------
+        res : dict
+            The decision at the new look, as returned by crossed().
+        """
+        cells = self.state['cells']
+        for cell, (n, conv) in counts.items():
+            cells[cell]['n'] += float(n)
+            cells[cell]['conv'] += float(conv)
+        n = [cells[cell]['n'] for cell in self.cells]
+        conv = [cells[cell]['conv'] for cell in self.cells]
+        z = pairwise_z(n, conv, self._pairs_)
+        q = sum(conv) / self._total_target_
+        self.state['history'].append([str(day), q, self._z_entry_(z)])
+        return self.crossed(verbose=verbose)
+
+    def plot(self):
+        """
+        Draw the boundary graph with the z_score line, save and show it.
+        """
+        plt = _pyplot_()
+        self.figbdr, self.axbdr = plt.subplots(1, 1, figsize=(7, 7))
+        self.bdry_plot(self.alpha_adj, self.beta)
+        self.z_plot(self.target, self.ttl, self.graph_fp)
 
     def _obf_bdr_(self, info_q, boundary_param):
         """
         Calculate z-score decision boundary values, using a Lan-Demets spending
-        function of O'Brien-Fleming type.
+        function of O'Brien-Fleming type. Looked up from the precomputed
+        boundary table (see boundary_table.py).
 
         Parameters
         ----------
@@ -72,33 +288,31 @@ class SeqAnalysis:
         f_z : list
             List of z-score boundary values.
         """
-        z = norm.ppf(1-boundary_param/2)
-        arg = z/np.sqrt(info_q)
-        f = 2-2*norm.cdf(arg)  # gives the p-value limit line
-        f_z = norm.ppf(f)*-1  # gives the Z-value limit line
-        return f_z
+        from boundary_table import z_boundary  # imports this module
+        return z_boundary(info_q, boundary_param)
 
     def z_score(self, target, data_fp):
         """
         Calculate the cumulative z-score, using the test data.
         """
         # DFs for each cell
-        res = {'ctrl': {}, 'test': {}}
+        res = {cell: {} for cell in self.cells}
         for cell in res.keys():
             data = pd.read_pickle(data_fp.format(cell))
             data['ctr'] = data['conv'] / data['n']
             data['var'] = data['ctr']*(1-data['ctr'])/data['n']
             res[cell]['by_day'] = data
         self.results = res
-        # z-score df
-        z_score = pd.DataFrame(index=res['ctrl']['by_day'].index,
-                               columns=['n', 'z', 'q'])
-        z_num = res['test']['by_day']['ctr'] - res['ctrl']['by_day']['ctr']
-        z_var_sq = res['test']['by_day']['var'] + res['ctrl']['by_day']['var']
-        z_denom = np.sqrt(z_var_sq)
-        z_score['z'] = z_num / z_denom
-        z_score['n'] = sum([res[c]['by_day']['conv'] for c in res.keys()])
-        z_score['q'] = z_score['n'] / target
+        # z-score df, all comparisons in one pass over (cells, days)
+        by_day = [res[cell]['by_day'] for cell in self.cells]
+        n = np.array([data['n'].values for data in by_day], dtype=float)
+        conv = np.array([data['conv'].values for data in by_day], dtype=float)
+        z = pairwise_z(n, conv, self._pairs_)
+        z_score = pd.DataFrame(index=by_day[0].index)
+        z_score['n'] = conv.sum(axis=0)
+        for col, z_col in zip(self._z_cols_, z):
+            z_score[col] = z_col
+        z_score['q'] = z_score['n'] / (target * len(self.cells) / 2)
         return z_score
 
     def bdry_plot(self, alpha, beta):
@@ -126,14 +340,27 @@ class SeqAnalysis:
         """
         Plots the z-score boundary lines, with appropriate shading. Saves it.
         """
+        plt = _pyplot_()
+        import matplotlib.ticker as mtick
         titledict = {'fontsize': 16}
-        self.axbdr.plot(self.z_score['q'], self.z_score['z'],
-                        color='#000000', marker='o')
+        history = self.history()
+        if len(self.comparisons) == 1:
+            self.axbdr.plot(history['q'], history['z'],
+                            color='#000000', marker='o')
+        else:
+            for i, (col, label) in enumerate(zip(self._z_cols_,
+                                                 self._labels_)):
+                self.axbdr.plot(history['q'], history[col], marker='o',
+                                color=palette[(i+1) % len(palette)],
+                                label=label.replace('_vs_', ' vs '))
+            self.axbdr.legend()
         self.axbdr.set_title(ttl, fontdict=titledict)
         self.axbdr.set_xlabel('% recruited')
         self.axbdr.set_ylabel('z-score')
         self.axbdr.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1))
         descrip = "Lan-DeMets spending function, O’Brien-Fleming type boundary"
+        if len(self.comparisons) > 1:
+            descrip += ", Bonferroni alpha/{}".format(len(self.comparisons))
         self.figbdr.text(0, 0, descrip, color='gray', fontsize=10)
         self.axbdr.set_ylim((-8, 8))
         self.axbdr.set_xlim((0, 1))
@@ -146,8 +373,11 @@ class SeqAnalysis:
         """
         Calculates and plots the daily and cumulative conversion rate per cell.
         """
+        plt = _pyplot_()
+        import matplotlib.ticker as mtick
         self.figcvr, self.axcvr = plt.subplots(1, 1, figsize=(10, 5))
-        colours = {'ctrl': '#1d1a1c', 'test': '#ee2a24'}
+        colours = {cell: palette[i % len(palette)]
+                   for i, cell in enumerate(self.cells)}
         daily = pd.DataFrame()
         for cell in self.results.keys():
             self.axcvr.plot(self.results[cell]['by_day']['ctr'], 'r-', lw=2,
@@ -156,7 +386,7 @@ class SeqAnalysis:
             daily_cell.iloc[0] = self.results[cell]['by_day'].iloc[0]
             daily_cell['ctr'] = daily_cell['conv'] / daily_cell['n']
             daily_cell['cell'] = cell
-            daily_cell.index = self.results['ctrl']['by_day'].index
+            daily_cell.index = self.results[self.cells[0]]['by_day'].index
             daily = pd.concat([daily, daily_cell])
             self.axcvr.plot(daily[daily['cell'] == cell]['ctr'], 'r-', lw=1,
                             color=colours[cell], label=cell+' by day',
@@ -171,45 +401,115 @@ class SeqAnalysis:
         self.axcvr.legend()
         plt.savefig('Outputs\\CTR_by_day.png', bbox_inches="tight")
 
-    def crossed(self):
+    def crossed(self, verbose=True, exact=False):
         """
-        Confirm if a boundary has been crossed
+        Confirm if a boundary has been crossed.
+
+        Parameters
+        ----------
+        exact : bool
+            Use exact group-sequential boundaries at every look so far (see
+            gs_boundaries.py), and report the first look that crossed one
+            rather than the spending curve at the latest look. The look
+            that reaches the target is the final analysis, where the
+            boundaries meet, so it always decides efficacy or futility.
+
+        Returns
+        -------
+        res : dict
+            Current day, z and q, the stop and futility boundaries at q, and
+            the decision: 'efficacy', 'futility' or 'continue'. With more
+            than one comparison, one such dict per 'b_vs_a' label.
         """
-        stop_bdr = self.alpha
+        stop_bdr = self.alpha_adj
         futi_bdr = self.beta
-        current_q = self.z_score.iloc[-1]['q']
-        current_z = self.z_score.iloc[-1]['z']
-        current_z_stop = self._obf_bdr_(current_q, stop_bdr)
-        current_z_futi = self._obf_bdr_(current_q, futi_bdr)*-1
-        print("Current z:", "%.2f" % current_z,
-              "\nStop bdry: +/-", "%.2f" % current_z_stop,
-              "\nFutility bdry:", "%.2f" % current_z_futi)
-        if current_z > abs(current_z_stop):
-            print("STOP: z crossed positive boundary. Close test, reject null")
-        elif current_z < current_z_futi:
-            print("STOP: z crossed futility boundary. Close test, null holds")
+        if exact:
+            from gs_boundaries import exact_boundaries
+            days, qs, zs = self._history_arrays_()
+            upper, lower = exact_boundaries(qs, stop_bdr, futi_bdr)
+            # stop at the first crossing, or the final analysis at q = 1
+            hit = ((zs > upper[:, None]) | (zs < lower[:, None]) |
+                   (qs >= 1)[:, None])
+            last = np.where(hit.any(axis=0), hit.argmax(axis=0), len(qs) - 1)
+            current_z_stop, current_z_futi = upper[last], lower[last]
+            current_day = [days[i] for i in last]
+            current_q, current_z = qs[last], zs[last, np.arange(zs.shape[1])]
         else:
-            print("z between boundaries - continue test")
+            # just the latest look, so update() stays O(1)
+            day, q, z = self.state['history'][-1]
+            current_z = np.atleast_1d(np.asarray(z, dtype=float))
+            current_q = np.full(len(current_z), float(q))
+            current_day = [day] * len(current_z)
+            current_z_stop = self._obf_bdr_(current_q, stop_bdr)
+            current_z_futi = self._obf_bdr_(current_q, futi_bdr)*-1
+        decision = np.select([current_z > np.abs(current_z_stop),
+                              current_z < current_z_futi],
+                             ['efficacy', 'futility'], 'continue')
+        msgs = {'efficacy': "STOP: z crossed positive boundary. "
+                            "Close test, reject null",
+                'futility': "STOP: z crossed futility boundary. "
+                            "Close test, null holds",
+                'continue': "z between boundaries - continue test"}
+        res = {}
+        for i, label in enumerate(self._labels_):
+            if verbose:
+                if label:
+                    print(label.replace('_vs_', ' vs ') + ':')
+                print("Current z:", "%.2f" % current_z[i],
+                      "\nStop bdry: +/-", "%.2f" % current_z_stop[i],
+                      "\nFutility bdry:", "%.2f" % current_z_futi[i])
+                print(msgs[decision[i]])
+            res[label] = {'day': current_day[i], 'q': float(current_q[i]),
+                          'z': float(current_z[i]),
+                          'stop': float(current_z_stop[i]),
+                          'futility': float(current_z_futi[i]),
+                          'decision': str(decision[i])}
+        return res[''] if len(res) == 1 else res
 
-    def summary(self):
+    def summary(self, verbose=True):
         """
         Print the test results, for reports.
-        N.B. assumes 'ctrl' and 'test' cells.
+
+        Returns
+        -------
+        res : dict
+            Final n, conv and ctr (%) per cell, z, one-sided p, and the
+            relative % change in conversion rate. With more than one
+            comparison, z, p and uplift sit under each 'b_vs_a' label.
         """
-        current_z = self.z_score.iloc[-1]['z']
-        for cell in self.results.keys():
-            for var in ['n', 'conv', 'ctr']:
-                _ = self.results[cell]['by_day'][var][-1]
+        current_zs = self._history_arrays_()[2][-1]
+        res = {}
+        for cell in self.cells:
+            for var in ['n', 'conv']:
+                _ = self.state['cells'][cell][var]
                 self.results[cell]['final_{}'.format(var)] = _
-            self.results[cell]['final_ctr'] *= 100
-            print(cell, "=", "%.0f" % self.results[cell]['final_conv'], "/",
-                  "%.0f" % self.results[cell]['final_n'], '=',
-                  "%.1f%%" % self.results[cell]['final_ctr'])
-        pct_uplift = (self.results['test']['final_ctr'] /
-                      self.results['ctrl']['final_ctr'])-1
-        print("the test statistic is z= {:.2f}".format(current_z),
-              ", p = {:.2f}".format(1 - norm.cdf(current_z)), '\n',
-              'the relative % change is ', "%.0f%%" % (pct_uplift*100))
+            self.results[cell]['final_ctr'] = (
+                self.results[cell]['final_conv'] /
+                self.results[cell]['final_n'] * 100)
+            res[cell] = {var: self.results[cell]['final_{}'.format(var)]
+                         for var in ['n', 'conv', 'ctr']}
+            if verbose:
+                print(cell, "=", "%.0f" % self.results[cell]['final_conv'],
+                      "/", "%.0f" % self.results[cell]['final_n'], '=',
+                      "%.1f%%" % self.results[cell]['final_ctr'])
+        for label, (a, b), current_z in zip(self._labels_, self.comparisons,
+                                            current_zs):
+            pct_uplift = (self.results[b]['final_ctr'] /
+                          self.results[a]['final_ctr'])-1
+            stats = {'z': float(current_z), 'p': 1 - norm.cdf(current_z),
+                     'uplift': pct_uplift*100}
+            if label:
+                res[label] = stats
+            else:
+                res.update(stats)
+            if verbose:
+                if label:
+                    print(label.replace('_vs_', ' vs ') + ':')
+                print("the test statistic is z= {:.2f}".format(current_z),
+                      ", p = {:.2f}".format(stats['p']), '\n',
+                      'the relative % change is ',
+                      "%.0f%%" % stats['uplift'])
+        return res
 
 
 # Tests
@@ -217,7 +517,7 @@ if __name__ == "__main__":
     two_month_vol, cvr = 3000, 0.214
     target = int(two_month_vol * cvr)
     ttl = 'CR046 email opt-in wording'
-    seq = SeqAnalysis(target, ttl)  # returns the plot!!
+    seq = SeqAnalysis(target, ttl)  # returns the plot!! plot=False doesn't
     seq.cvr_plot(ttl)
     seq.crossed()
     seq.summary()
\ No newline at end of file
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Sequential analysis of the average gift, as a Welch t-test.
+
+The t-boundaries are the SeqAnalysis z-boundaries converted via their
+p-values, at each look's Welch-Satterthwaite degrees of freedom.
+"""
+
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy.stats import t
+
+from SeqAnalysis import _pyplot_, obf_t_boundary
+from cumulative_moments import cumulative_moments, welch_t
+
+
+@lru_cache(maxsize=4096)
+def _cached_t_bdr_(info_q, boundary_param, degf):
+    return float(obf_t_boundary(info_q, boundary_param, degf))
+
+
+def t_bdr(info_q, boundary_param, degf):
+    """
+    obf_t_boundary for one look, memoised on (q, df) with LRU eviction.
+
+    q is rounded to 4 dp and df down to a whole number, so repeated checks
+    of the same test hit the cache. Rounding df down gives a (very
+    slightly) wider boundary, never a narrower one.
+    """
+    return _cached_t_bdr_(round(float(info_q), 4), boundary_param,
+                          float(np.floor(degf)))
+
+
+class SeqTTest:
+    """
+    Perform and visualise sequential analysis on the average gift.
+
+    ...
+
+    Attributes
+    ----------
+    t_score: pd.DataFrame
+        By day: total gifts n, Welch-Satterthwaite df, Welch t, information
+        quotient q, and the exact stop/futility t-boundaries at the looks.
+    results: dict
+        The cumulative n, mean and variance by day. One entry per cell.
+    figt, axt: plt items for the boundary plot, set by plot()
+    """
+    def __init__(self, target, ttl, data_fp='AmendedData\\LBL.csv',
+                 graph_fp='Outputs\\Results_Target{}_ttest.png',
+                 alpha=0.05, beta=0.2, plot=True, cells=('ctrl', 'test'),
+                 trim=100, lbl=None):
+        """
+        Initiates the sequential t-test object.
+
+        Parameters
+        ----------
+        target : int
+            The target number of gifts.
+        ttl : string
+            The title of the boundary graph.
+        data_fp : string
+            File path of the per-gift LBL CSV, as written by lbl_ga_join.py.
+        graph_fp : string
+            Destination file path of the boundary graph with t_score line.
+        plot : bool
+            Draw, save and show the boundary graph now.
+        cells : list
+            Control and test cell names.
+        trim : float
+            Gifts above this value are dropped, to trim the mean. None keeps
+            every gift.
+        lbl : pd.DataFrame
+            Per-gift data with date, cell and value columns, instead of
+            reading data_fp.
+        """
+        self.target, self.ttl, self.graph_fp = target, ttl, graph_fp
+        self.alpha, self.beta = alpha, beta
+        self.cells = list(cells)
+        self.q = np.linspace(0.06, 1, 30)  # information quotient
+        if lbl is None:
+            lbl = pd.read_csv(data_fp)
+            lbl['date'] = pd.to_datetime(lbl['date'], dayfirst=True)
+        if trim is not None:
+            lbl = lbl[lbl['value'] <= trim]
+        self.results = cumulative_moments(lbl['date'], lbl['cell'],
+                                          lbl['value'], self.cells)
+        self.t_score = self.t_score(target)
+        if plot:
+            self.plot()
+
+    def t_score(self, target):
+        """
+        Calculate the cumulative Welch t-score and its df, by day.
+        """
+        ctrl, test = (self.results[cell] for cell in self.cells)
+        se2 = [cumu['var']/cumu['n'] for cumu in (ctrl, test)]
+        t_score = pd.DataFrame(index=ctrl.index)
+        t_score['n'] = ctrl['n'] + test['n']
+        # Welch-Satterthwaite
+        t_score['df'] = (se2[0] + se2[1])**2 / (
+            se2[0]**2/(ctrl['n']-1) + se2[1]**2/(test['n']-1))
+        t_score['t'] = welch_t(ctrl, test)
+        t_score['q'] = t_score['n'] / target
+        t_score.dropna(inplace=True)  # days before both cells have 2 gifts
+        # Exact group-sequential boundaries at the looks actually taken
+        from boundary_table import get_table
+        from gs_boundaries import exact_boundaries
+        stop_z, futil_z = exact_boundaries(t_score['q'].values, self.alpha,
+                                           self.beta)
+        t_score['stop'] = get_table().t_from_z(stop_z, t_score['df'].values)
+        t_score['futility'] = get_table().t_from_z(futil_z,
+                                                   t_score['df'].values)
+        return t_score
+
+    def plot(self):
+        """
+        Plot the t-score boundary lines at the latest df, the exact
+        boundaries at each look, and the t_score line. Saves it.
+        """
+        plt = _pyplot_()
+        import matplotlib.ticker as mtick
+        degf = self.t_score['df'].iloc[-1]
+        q = self.q
+        f_t = obf_t_boundary(q, self.alpha, degf)
+        futility = obf_t_boundary(q, self.beta, degf)*-1
+
+        self.figt, self.axt = plt.subplots(1, 1, figsize=(7, 7))
+        axt = self.axt
+        axt.plot(q, f_t, 'r-', lw=1, alpha=0.6, color='g')  # success
+        axt.plot(q, -f_t, 'r-', lw=1, alpha=0.6, color='r')  # failure
+        axt.plot(q, futility, 'r-', lw=1, alpha=0.6, color='k')  # futility
+        axt.fill_between(q, f_t, max(f_t)*np.ones(len(f_t)), color='g',
+                         alpha=0.5)
+        axt.fill_between(q, -f_t, min(-f_t)*np.ones(len(f_t)), color='r',
+                         alpha=0.5)
+        axt.fill_between(q, futility, -f_t, alpha=0.3, color='k')
+
+        t_score = self.t_score
+        axt.plot(t_score['q'], t_score['t'], color='#000000', marker='o')
+        axt.plot(t_score['q'], t_score['stop'], ':', color='g',
+                 drawstyle='steps')
+        axt.plot(t_score['q'], t_score['futility'], ':', color='k',
+                 drawstyle='steps')
+        axt.set_title(self.ttl, fontsize=16)
+        axt.set_xlabel('% recruited')
+        axt.set_ylabel('t-score')
+        axt.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1))
+        descrip = "Lan-DeMets spending function, O’Brien-Fleming type " \
+                  "boundaries"
+        self.figt.text(0, -0.05, descrip, color='gray', fontsize=10)
+        axt.set_ylim((-8, 8))
+        axt.set_xlim((0, 1))
+        plt.tight_layout()
+        plt.savefig(self.graph_fp.format(str(self.target)))
+        plt.show()
+
+    def crossed(self, verbose=True, exact=False):
+        """
+        Confirm if a boundary has been crossed.
+
+        Parameters
+        ----------
+        exact : bool
+            Use the exact group-sequential boundaries in t_score, and report
+            the first look that crossed one rather than the spending curve
+            at the latest look. The look that reaches the target is the
+            final analysis, where the boundaries meet, so it always decides
+            efficacy or futility.
+
+        Returns
+        -------
+        res : dict
+            Current day, t, df and q, the stop and futility boundaries, and
+            the decision: 'efficacy', 'futility' or 'continue'.
+        """
+        t_score = self.t_score
+        if exact:
+            hit = ((t_score['t'] > t_score['stop']) |
+                   (t_score['t'] < t_score['futility']) |
+                   (t_score['q'] >= 1)).values
+            last = hit.argmax() if hit.any() else len(t_score) - 1
+            current = t_score.iloc[last]
+            current_t_stop = current['stop']
+            current_t_futi = current['futility']
+        else:
+            current = t_score.iloc[-1]
+            current_t_stop = t_bdr(current['q'], self.alpha, current['df'])
+            current_t_futi = t_bdr(current['q'], self.beta, current['df'])*-1
+        current_t = current['t']
+        if current_t > abs(current_t_stop):
+            decision = 'efficacy'
+            msg = "STOP: t crossed outer boundary - stop test, reject null"
+        elif current_t < current_t_futi:
+            decision = 'futility'
+            msg = "STOP: t crossed futility boundary - stop test, but " \
+                  "don't reject H0"
+        else:
+            decision = 'continue'
+            msg = "t between boundaries - continue test"
+        if verbose:
+            print("Current t:", "%.2f" % current_t,
+                  "\nStop bdry: +/-", "%.2f" % current_t_stop,
+                  "\nFutility bdry:", "%.2f" % current_t_futi)
+            print(msg)
+        return {'day': current.name, 'q': float(current['q']),
+                't': float(current_t), 'df': float(current['df']),
+                'stop': float(current_t_stop),
+                'futility': float(current_t_futi), 'decision': decision}
+
+    def summary(self, verbose=True):
+        """
+        Print the test results, for reports.
+
+        Returns
+        -------
+        res : dict
+            Final n, mean and sd per cell, t, df, one-sided p, and the
+            relative % change in the average gift.
+        """
+        res = {}
+        for cell in self.cells:
+            final = self.results[cell].iloc[-1]
+            res[cell] = {'n': float(final['n']),
+                         'mean': float(final['mean']),
+                         'sd': float(np.sqrt(final['var']))}
+            if verbose:
+                print("{}: n = {:.0f}, mean = £{:.2f}, sd = £{:.2f}".format(
+                    cell, final['n'], final['mean'], res[cell]['sd']))
+        current = self.t_score.iloc[-1]
+        pct_uplift = res[self.cells[1]]['mean'] / res[self.cells[0]]['mean']-1
+        res.update({'t': float(current['t']), 'df': float(current['df']),
+                    'p': float(t.sf(current['t'], current['df'])),
+                    'uplift': pct_uplift*100})
+        if verbose:
+            print("the test statistic is t= {:.2f}".format(res['t']),
+                  "(df = {:.0f})".format(res['df']),
+                  ", p = {:.2f}".format(res['p']), '\n',
+                  'the relative % change is ', "%.0f%%" % res['uplift'])
+        return res
+
+
+# Tests
+if __name__ == "__main__":
+    target = 1000
+    ttl = 'CRO55 raised prompt test_average gift'
+    seq = SeqTTest(target, ttl)
+    seq.crossed()
+    seq.summary()
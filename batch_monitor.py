@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Sequential monitoring of many two-cell conversion tests at once.
+
+Same statistics and boundaries as SeqAnalysis, computed for every
+experiment and day in single numpy passes.
+"""
+
+import numpy as np
+import pandas as pd
+
+from SeqAnalysis import obf_boundary
+
+
+def batch_monitor(cumu, target, alpha=0.05, beta=0.2, names=None):
+    """
+    z-scores, information quotients, boundaries and decisions for a stack of
+    experiments.
+
+    Parameters
+    ----------
+    cumu : np.array
+        Cumulative counts, shape (experiments, 2, days, 2): cells are
+        (ctrl, test), the last axis is (n, conv). Days are aligned across
+        experiments; pad finished tests by repeating their last day.
+    target : int, np.array
+        Target conversion volume, one for all or one per experiment.
+    alpha, beta : float
+        Spending function parameters, as in SeqAnalysis.
+    names : list
+        Experiment names for the decision table. Defaults to 0..E-1.
+
+    Returns
+    -------
+    res : dict
+        'z', 'q', 'stop', 'futility': np.arrays of shape (experiments, days).
+        'decisions': pd.DataFrame with one row per experiment - the latest
+        q, z and boundaries, the decision ('efficacy', 'futility' or
+        'continue'), and the first day index each boundary was crossed
+        (-1 if never).
+    """
+    cumu = np.asarray(cumu, dtype=float)
+    n, conv = cumu[..., 0], cumu[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ctr = conv / n
+        var = ctr*(1-ctr)/n
+        z = (ctr[:, 1] - ctr[:, 0]) / np.sqrt(var[:, 1] + var[:, 0])
+        q = conv.sum(axis=1) / np.reshape(target, (-1, 1))
+        stop = obf_boundary(q, alpha)
+        futility = obf_boundary(q, beta)*-1
+    crossed_stop = z > np.abs(stop)
+    crossed_futility = z < futility
+    decision = np.select([crossed_stop[:, -1], crossed_futility[:, -1]],
+                         ['efficacy', 'futility'], 'continue')
+
+    def first_day(crossed):
+        return np.where(crossed.any(axis=1), crossed.argmax(axis=1), -1)
+
+    decisions = pd.DataFrame({'q': q[:, -1], 'z': z[:, -1],
+                              'stop': stop[:, -1],
+                              'futility': futility[:, -1],
+                              'decision': decision,
+                              'first_efficacy_day': first_day(crossed_stop),
+                              'first_futility_day': first_day(
+                                  crossed_futility)},
+                             index=names)
+    return {'z': z, 'q': q, 'stop': stop, 'futility': futility,
+            'decisions': decisions}
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(1234)
+    num_exps, num_days = 5000, 60
+    daily_n = rng.integers(50, 150, size=(num_exps, 2, num_days))
+    rates = np.stack([np.full(num_exps, 0.2),
+                      0.2 * rng.uniform(0.9, 1.2, num_exps)], axis=1)
+    daily_conv = rng.binomial(daily_n, rates[:, :, None])
+    cumu = np.stack([daily_n, daily_conv], axis=-1).cumsum(axis=2)
+    tic = time.perf_counter()
+    res = batch_monitor(cumu, target=1000)
+    toc = time.perf_counter() - tic
+    print("{} experiments x {} days in {:.3f}s".format(num_exps, num_days,
+                                                       toc))
+    print(res['decisions']['decision'].value_counts())
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed O'Brien-Fleming type boundaries, looked up by interpolation.
+
+The z-boundary is tabulated over information quotient x boundary parameter
+(alpha or beta), and its conversion to a t-boundary over z x degrees of
+freedom. Both grids are dense enough that bilinear interpolation stays
+within tol of the exact scipy values; this is checked against random
+off-grid points whenever the table is built. Lookups outside the grids
+fall back to the exact calculation, so the bound holds everywhere.
+"""
+
+import os
+import numpy as np
+from scipy.stats import norm, t
+
+from SeqAnalysis import obf_boundary
+
+TABLE_FP = 'AmendedData\\BoundaryTable.npz'
+VERSION = 1
+
+
+def _t_from_z_(z, inv_df):
+    """Exact t-score with the same upper tail p-value as z, df = 1/inv_df"""
+    z, inv_df = np.broadcast_arrays(z, inv_df)
+    res = np.array(z, dtype=float)
+    finite = inv_df > 0
+    res[finite] = t.isf(norm.sf(z[finite]), 1/inv_df[finite])
+    return res
+
+
+def _interp2_(grid, x0, dx, y0, dy, x, y):
+    """Bilinear interpolation on a regular grid, for in-range x and y"""
+    fx, fy = (x - x0) / dx, (y - y0) / dy
+    i = np.clip(fx.astype(int), 0, grid.shape[0] - 2)
+    j = np.clip(fy.astype(int), 0, grid.shape[1] - 2)
+    a, b = fx - i, fy - j
+    return ((1-a)*(1-b)*grid[i, j] + a*(1-b)*grid[i+1, j] +
+            (1-a)*b*grid[i, j+1] + a*b*grid[i+1, j+1])
+
+
+class BoundaryTable:
+    """
+    Interpolated z- and t-boundaries.
+
+    The z grid is over log(q) and log(boundary_param), storing
+    boundary*sqrt(q), which is nearly flat in q. The t grid is over z and
+    1/df, storing t - z, which is zero at df = infinity.
+
+    Attributes
+    ----------
+    max_error: dict
+        Largest absolute error against scipy seen in the build-time check,
+        for 'z' and 't'.
+    """
+    def __init__(self, q_range=(0.01, 4), param_range=(0.001, 0.5),
+                 z_max=10, df_min=30, shape_z=(1200, 600),
+                 shape_t=(2000, 400), tol=2e-4, arrays=None):
+        self.q_range, self.param_range = q_range, param_range
+        self.z_max, self.df_min, self.tol = z_max, df_min, tol
+        self._u_ = np.linspace(np.log(q_range[0]), np.log(q_range[1]),
+                               shape_z[0])
+        self._v_ = np.linspace(np.log(param_range[0]),
+                               np.log(param_range[1]), shape_z[1])
+        self._x_ = np.linspace(0, z_max, shape_t[0])
+        self._w_ = np.linspace(0, 1/df_min, shape_t[1])
+        if arrays is None:
+            uu, vv = np.meshgrid(self._u_, self._v_, indexing='ij')
+            self._zgrid_ = obf_boundary(np.exp(uu), np.exp(vv))*np.exp(uu/2)
+            xx, ww = np.meshgrid(self._x_, self._w_, indexing='ij')
+            self._tgrid_ = _t_from_z_(xx, ww) - xx
+            self.max_error = self._check_()
+        else:
+            self._zgrid_, self._tgrid_ = arrays['zgrid'], arrays['tgrid']
+            self.max_error = {'z': float(arrays['max_error_z']),
+                              't': float(arrays['max_error_t'])}
+
+    def _check_(self, num=200000, seed=0):
+        """Max interpolation error on random off-grid points"""
+        rng = np.random.default_rng(seed)
+        q = np.exp(rng.uniform(self._u_[0], self._u_[-1], num))
+        p = np.exp(rng.uniform(self._v_[0], self._v_[-1], num))
+        z_err = np.abs(self.z_boundary(q, p) - obf_boundary(q, p)).max()
+        z = rng.uniform(0, self.z_max, num)
+        inv_df = rng.uniform(0, 1/self.df_min, num)
+        t_err = np.abs(self.t_from_z(z, 1/inv_df) -
+                       _t_from_z_(z, inv_df)).max()
+        max_error = {'z': z_err, 't': t_err}
+        if max(max_error.values()) > self.tol:
+            raise ValueError("Boundary table error {} exceeds tol {}. "
+                             "Use a denser grid.".format(max_error, self.tol))
+        return max_error
+
+    def z_boundary(self, info_q, boundary_param):
+        """Same as SeqAnalysis.obf_boundary, within tol"""
+        info_q, boundary_param = np.broadcast_arrays(
+            np.asarray(info_q, dtype=float),
+            np.asarray(boundary_param, dtype=float))
+        inside = ((info_q >= self.q_range[0]) &
+                  (info_q <= self.q_range[1]) &
+                  (boundary_param >= self.param_range[0]) &
+                  (boundary_param <= self.param_range[1]))
+        if not inside.all():
+            res = obf_boundary(info_q, boundary_param)
+            res[inside] = self.z_boundary(info_q[inside],
+                                          boundary_param[inside])
+            return res[()]
+        u, v = np.log(info_q), np.log(boundary_param)
+        res = _interp2_(self._zgrid_, self._u_[0], self._u_[1] - self._u_[0],
+                        self._v_[0], self._v_[1] - self._v_[0], u, v)
+        return (res * np.exp(-u/2))[()]
+
+    def t_from_z(self, z, degf):
+        """t-score with the same upper tail p-value as z, within tol"""
+        z, degf = np.broadcast_arrays(np.asarray(z, dtype=float),
+                                      np.asarray(degf, dtype=float))
+        inside = (np.abs(z) <= self.z_max) & (degf >= self.df_min)
+        if not inside.all():
+            res = _t_from_z_(z, 1/degf)
+            res[inside] = self.t_from_z(z[inside], degf[inside])
+            return res[()]
+        x = np.abs(z)
+        res = x + _interp2_(self._tgrid_, 0, self._x_[1], 0, self._w_[1],
+                            x, 1/degf)
+        return (np.sign(z) * res)[()]
+
+    def t_boundary(self, info_q, boundary_param, degf):
+        """Same as SeqAnalysis.obf_t_boundary, within tol"""
+        return self.t_from_z(self.z_boundary(info_q, boundary_param), degf)
+
+    def save(self, fp=TABLE_FP):
+        # scripts run in parallel may each build the table on first use:
+        # write to a file of our own, then swap it in whole
+        tmp_fp = '{}.{}.tmp'.format(fp, os.getpid())
+        with open(tmp_fp, 'wb') as f:
+            np.savez(f, version=VERSION, zgrid=self._zgrid_,
+                     tgrid=self._tgrid_, max_error_z=self.max_error['z'],
+                     max_error_t=self.max_error['t'])
+        os.replace(tmp_fp, fp)
+
+    @classmethod
+    def load(cls, fp=TABLE_FP):
+        with np.load(fp) as arrays:
+            if int(arrays['version']) != VERSION:
+                raise ValueError("Stale boundary table at {}".format(fp))
+            return cls(arrays=dict(arrays))
+
+
+_table_ = None
+
+
+def get_table(fp=TABLE_FP):
+    """The boundary table, loaded from fp or built and saved on first use"""
+    global _table_
+    if _table_ is None:
+        try:
+            _table_ = BoundaryTable.load(fp)
+        except (OSError, ValueError, KeyError):
+            _table_ = BoundaryTable()
+            if os.path.isdir(os.path.dirname(fp) or '.'):
+                _table_.save(fp)
+    return _table_
+
+
+def z_boundary(info_q, boundary_param):
+    """Interpolated SeqAnalysis.obf_boundary"""
+    return get_table().z_boundary(info_q, boundary_param)
+
+
+def t_boundary(info_q, boundary_param, degf):
+    """Interpolated SeqAnalysis.obf_t_boundary"""
+    return get_table().t_boundary(info_q, boundary_param, degf)
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    from SeqAnalysis import obf_t_boundary
+    tic = time.perf_counter()
+    table = get_table()
+    print("Loaded/built table in {:.2f}s, max error {}".format(
+        time.perf_counter() - tic, table.max_error))
+    rng = np.random.default_rng(1)
+    q = rng.uniform(0.06, 1, 1000000)
+    degf = rng.uniform(100, 5000, 1000000)
+    for name, exact, lookup in [
+            ('z', lambda: obf_boundary(q, 0.05),
+             lambda: table.z_boundary(q, 0.05)),
+            ('t', lambda: obf_t_boundary(q, 0.05, degf),
+             lambda: table.t_boundary(q, 0.05, degf))]:
+        tic = time.perf_counter()
+        ref = exact()
+        t_exact = time.perf_counter() - tic
+        tic = time.perf_counter()
+        est = lookup()
+        t_lookup = time.perf_counter() - tic
+        print("{}: scipy {:.3f}s, table {:.3f}s for 1e6 points, "
+              "max error {:.1e}".format(name, t_exact, t_lookup,
+                                        np.abs(est - ref).max()))
+    # one look at a time, as in SeqAnalysis.crossed()
+    for name, func in [('scipy', lambda x: obf_t_boundary(x, 0.05, 998)),
+                       ('table', lambda x: table.t_boundary(x, 0.05, 998))]:
+        tic = time.perf_counter()
+        for x in q[:10000]:
+            func(x)
+        print("{}: {:.1f}us per single t-boundary".format(
+            name, (time.perf_counter() - tic) / 10000 * 1e6))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Cumulative daily series per test cell, from GA daily counts.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def daily_array(frames, start, end, cells=None):
+    """
+    Pivot GA daily counts into a date x cell x metric array.
+
+    Parameters
+    ----------
+    frames : dict
+        Metric name (e.g. 'n', 'conv') to DataFrame with columns cell, date,
+        count - as written by FetchData.
+    start, end : string
+        Date range. Days with no rows are filled with zero.
+    cells : list
+        Cells to include, in order. Defaults to every cell in the data.
+
+    Returns
+    -------
+    dates : pd.DatetimeIndex
+    cells : list
+    metrics : list
+    counts : np.array
+        Daily counts, shape (dates, cells, metrics).
+    """
+    metrics = list(frames.keys())
+    stacked = pd.concat({m: df.groupby(['date', 'cell'])['count'].sum()
+                         for m, df in frames.items()}, names=['metric'])
+    if cells is None:
+        cells = sorted(stacked.index.get_level_values('cell').unique())
+    dates = pd.date_range(start=start, end=end)
+    wide = stacked.unstack(['cell', 'metric'])
+    wide = wide.reindex(index=dates,
+                        columns=pd.MultiIndex.from_product([cells, metrics]),
+                        fill_value=0).fillna(0)
+    dtype = np.result_type(*[df['count'].dtype for df in frames.values()])
+    counts = wide.to_numpy(dtype=dtype).reshape(len(dates), len(cells),
+                                                len(metrics))
+    return dates, cells, metrics, counts
+
+
+def cumulative_series(tots, convs, start, end, cells=None):
+    """
+    Cumulative n, conversions, conversion rate and variance by day, for any
+    number of cells, in one cumsum pass.
+
+    Returns
+    -------
+    res : dict
+        Cell to DataFrame in the CumuData{cell}.pkl layout read by
+        SeqAnalysis: a daily index and columns n, conv, ctr, var.
+    """
+    dates, cells, metrics, counts = daily_array({'n': tots, 'conv': convs},
+                                                start, end, cells)
+    cumu = counts.cumsum(axis=0)
+    n, conv = cumu[:, :, 0], cumu[:, :, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ctr = conv / n
+        var = ctr*(1-ctr)/n
+    res = {}
+    for i, cell in enumerate(cells):
+        res[cell] = pd.DataFrame({'n': n[:, i], 'conv': conv[:, i],
+                                  'ctr': ctr[:, i], 'var': var[:, i]},
+                                 index=dates)
+    return res
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache for GA API pages, so daily runs only download new days.
+
+Entries are per query and per day, keyed by (view id, metrics, dimensions,
+segment, filters, date). Queries are split into single days, so they
+should include ga:date as a dimension for the merged rows to add up to
+the same totals as a single range query.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+
+import GAAccess as ga
+
+
+class GACache:
+    """
+    Serve GA data for closed days from disk, and fetch only what's missing.
+
+    A day is closed once it is more than open_days old: GA can still revise
+    the figures before then. A cached day is used if it was fetched after it
+    closed, or (for days still open) if it was fetched less than ttl_hours
+    ago. Everything else is re-fetched, concurrently, one day per request.
+    Days GA still samples are used but not cached, so they're re-fetched on
+    every run until GA serves them unsampled.
+
+    Attributes
+    ----------
+    hits, misses, stale: int
+        Days served from disk, days never cached, and days re-fetched
+        because the cached copy could still have been revised.
+    sampled: int
+        Days fetched that GA sampled, and so weren't cached.
+    api_seconds: float
+        Wall-clock seconds spent waiting on the API.
+    """
+    def __init__(self, cache_dir='RawData\\GACache', open_days=3,
+                 ttl_hours=6, workers=4):
+        self.cache_dir = cache_dir
+        self.open_days = open_days
+        self.ttl = timedelta(hours=ttl_hours)
+        self.workers = workers
+        self.hits, self.misses, self.stale, self.sampled = 0, 0, 0, 0
+        self.api_seconds = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path_(self, gaid, metrics, dims, segment, filters, day):
+        """Cache file for one query on one day"""
+        key = json.dumps([gaid, list(metrics), list(dims), segment, filters,
+                          day])
+        name = hashlib.sha1(key.encode()).hexdigest() + '.json.gz'
+        return os.path.join(self.cache_dir, name)
+
+    def _is_valid_(self, entry, day, now):
+        """Whether a cached day can be served without re-fetching"""
+        fetched_at = datetime.fromisoformat(entry['fetched_at'])
+        closes_at = datetime.strptime(day, '%Y-%m-%d') + timedelta(
+            days=self.open_days + 1)
+        return fetched_at >= closes_at or now - fetched_at < self.ttl
+
+    def _read_(self, fp):
+        with gzip.open(fp, 'rt') as f:
+            return json.load(f)
+
+    def _write_(self, fp, pages, now):
+        tmp_fp = fp + '.tmp'
+        with gzip.open(tmp_fp, 'wt') as f:
+            json.dump({'fetched_at': now.isoformat(), 'pages': pages}, f)
+        os.replace(tmp_fp, fp)
+
+    def get_data(self, gaid, start, end, metrics, dims, token, segment,
+                 filters="", max_results=10000, api_root=ga.API_ROOT):
+        """
+        Create generator to yield GA API data for start to end, day by day,
+        with the same arguments and page format as GAAccess.get_data.
+        """
+        now = datetime.now()
+        days = [d.strftime('%Y-%m-%d')
+                for d in pd.date_range(start=start, end=end)]
+        paths = {d: self._path_(gaid, metrics, dims, segment, filters, d)
+                 for d in days}
+        pages, to_fetch = {}, []
+        for day in days:
+            if not os.path.exists(paths[day]):
+                self.misses += 1
+                to_fetch.append(day)
+                continue
+            entry = self._read_(paths[day])
+            if self._is_valid_(entry, day, now):
+                self.hits += 1
+                pages[day] = entry['pages']
+            else:
+                self.stale += 1
+                to_fetch.append(day)
+
+        if len(to_fetch) > 0:
+            session = ga.get_session(self.workers)
+
+            def fetch(day):
+                day_pages = list(ga.get_data(gaid, day, day, metrics, dims,
+                                             token, segment, filters=filters,
+                                             max_results=max_results,
+                                             session=session,
+                                             api_root=api_root))
+                if 'error' in day_pages[0]:  # e.g. expired token; don't cache
+                    raise RuntimeError(day_pages[0]['error'].get('message'))
+                if day_pages[0].get('containsSampledData'):
+                    print("{} is sampled even for a single day; not "
+                          "cached".format(day))
+                return day_pages
+
+            tic = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for day, day_pages in zip(to_fetch, pool.map(fetch,
+                                                             to_fetch)):
+                    # a sampled day is re-fetched next run, not kept for good
+                    if day_pages[0].get('containsSampledData'):
+                        self.sampled += 1
+                    else:
+                        self._write_(paths[day], day_pages, now)
+                    pages[day] = day_pages
+            self.api_seconds += time.perf_counter() - tic
+
+        for day in days:
+            for data in pages[day]:
+                yield data
+
+    def invalidate(self, gaid, start, end, metrics, dims, segment,
+                   filters=""):
+        """Delete the cached days of a query, e.g. after a GA data fix"""
+        for d in pd.date_range(start=start, end=end):
+            fp = self._path_(gaid, metrics, dims, segment, filters,
+                             d.strftime('%Y-%m-%d'))
+            if os.path.exists(fp):
+                os.remove(fp)
+
+    def stats(self):
+        """Hit/miss counters, and the API time spent on the misses"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'stale': self.stale, 'sampled': self.sampled,
+                'api_seconds': self.api_seconds}
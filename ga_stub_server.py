@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the GA Core Reporting API (v3), for benchmarking
+GAAccess offline.
+
+Serves deterministic rows for any date range: rows_per_day rows per day,
+with values made up from the requested dimensions/metrics. Each request
+sleeps for latency seconds to mimic the round trip to googleapis.com.
+"""
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import urllib
+
+import GAAccess as ga
+
+
+def _dim_value(dim, day, i):
+    """Fake value for one dimension, for row i of a given day"""
+    if dim == 'ga:date':
+        return day.strftime('%Y%m%d')
+    if dim == 'ga:experimentCombination':
+        return 'oVywWgO-Q5K5Dclek-6gKQ:{}'.format(i % 2)
+    if dim == 'ga:transactionId':
+        return 'T{}{:05d}'.format(day.strftime('%Y%m%d'), i)
+    return '{}{}'.format(dim.replace('ga:', ''), i)
+
+
+class StubGAHandler(BaseHTTPRequestHandler):
+    """Answer GET requests in the shape of the GA v3 data endpoint"""
+    latency = 0.05
+    rows_per_day = 100
+    sample_days = None  # queries spanning more days than this are sampled
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parsed = urllib.parse.urlparse(self.path)
+        query = {k: v[0] for k, v in
+                 urllib.parse.parse_qs(parsed.query).items()}
+        start = datetime.strptime(query['start-date'], '%Y-%m-%d')
+        end = datetime.strptime(query['end-date'], '%Y-%m-%d')
+        dims = query.get('dimensions', '').split(',')
+        metrics = query['metrics'].split(',')
+        max_results = int(query.get('max-results', 1000))
+        start_index = int(query.get('start-index', 1))
+        num_days = (end - start).days + 1
+        total = num_days * self.rows_per_day
+        rows = []
+        for j in range(start_index - 1,
+                       min(start_index - 1 + max_results, total)):
+            day = start + timedelta(j // self.rows_per_day)
+            i = j % self.rows_per_day
+            rows.append([_dim_value(d, day, i) for d in dims] +
+                        [str(1 + (i + k) % 7) for k in range(len(metrics))])
+        headers = [{'name': d, 'columnType': 'DIMENSION',
+                    'dataType': 'STRING'} for d in dims]
+        headers += [{'name': m, 'columnType': 'METRIC',
+                     'dataType': 'INTEGER'} for m in metrics]
+        sampled = self.sample_days is not None and num_days > self.sample_days
+        body = {'kind': 'analytics#gaData',
+                'itemsPerPage': max_results,
+                'totalResults': total,
+                'containsSampledData': sampled,
+                'columnHeaders': headers,
+                'rows': rows}
+        if start_index - 1 + max_results < total:
+            next_query = dict(query, **{
+                'start-index': str(start_index + max_results)})
+            next_query.pop('access_token', None)
+            body['nextLink'] = '{}://{}{}?{}'.format(
+                'http', self.headers['Host'], parsed.path,
+                urllib.parse.urlencode(next_query))
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0, latency=0.05, rows_per_day=100, sample_days=None):
+    """
+    Start the stub server on a background thread.
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+        Call server.shutdown() when done.
+    api_root : string
+        Pass as api_root to GAAccess.get_data.
+    """
+    handler = type('Handler', (StubGAHandler,),
+                   {'latency': latency, 'rows_per_day': rows_per_day,
+                    'sample_days': sample_days})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_root = 'http://127.0.0.1:{}/analytics/v3/data/ga'.format(
+        server.server_address[1])
+    return server, api_root
+
+
+# Benchmark
+if __name__ == "__main__":
+    server, api_root = serve(latency=0.1, rows_per_day=1000)
+    query = {'gaid': 'ga:149197394', 'start': '2020-05-20',
+             'end': '2020-06-19', 'metrics': ['ga:users'],
+             'dims': ['ga:experimentCombination', 'ga:date'],
+             'token': 'stub', 'segment': 'gaid::-1',
+             'max_results': 1000, 'api_root': api_root}
+    for workers in [1, 4, 8]:
+        tic = time.perf_counter()
+        pages = list(ga.get_data(workers=workers, **query))
+        toc = time.perf_counter() - tic
+        print("workers={}: {} pages, {} rows in {:.2f}s".format(
+            workers, len(pages), sum(len(p['rows']) for p in pages), toc))
+    server.shutdown()
+    # Sharded transaction ID pull, from a server that samples any query
+    # over 3 days: weekly shards are re-split until none are sampled
+    server, api_root = serve(latency=0.1, rows_per_day=1000, sample_days=3)
+    query.update(dims=['ga:experimentCombination', 'ga:transactionId'],
+                 api_root=api_root)
+    for freq in ['W', 'D']:
+        tic = time.perf_counter()
+        pages = list(ga.get_sharded_data(freq=freq, workers=8, **query))
+        toc = time.perf_counter() - tic
+        print("freq={}: {} pages, {} sampled, {} rows in {:.2f}s".format(
+            freq, len(pages), sum(p['containsSampledData'] for p in pages),
+            sum(len(p['rows']) for p in pages), toc))
+    server.shutdown()
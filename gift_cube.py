@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-aggregated gift value distributions, for plotting and describing slices
+of the line-by-line data without rescanning the gifts.
+
+The cube has one row per month x medium x UK GFR flag x email send number x
+cell, built in one grouped pass. For each row it keeps, per value bin, the
+count, sum, sum of squares, min and max of the gifts, and the number equal
+to the min. The bins are £1 wide up to £100, then coarser, so any histogram
+on whole pound edges is a sum of bins, and counts, means and standard
+deviations of any slice (or of gifts under a whole pound limit) are exact.
+Quantiles put a bin's at_min gifts at its min and spread the rest evenly up
+to its max, so are exact for the round amounts (£10, £25...) most gifts
+are.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+CUBE_FP = 'AmendedData\\GiftCube.npz'
+VERSION = 1
+KEYS = ['month', 'medium', 'ukgfr', 'sendnum', 'cell']
+EDGES = np.r_[np.arange(0, 101), 200, 500, 1000, 10000, np.inf]
+STATS = ['count', 'sum', 'sumsq', 'min', 'max', 'at_min']
+
+
+def send_number(medium, creative):
+    """Email send number from Donate_<num>_... creatives, else ''"""
+    parts = creative.astype(str).str.split('_', n=2, expand=True)
+    is_send = (medium == 'Email') & creative.str.startswith('Donate',
+                                                            na=False)
+    if parts.shape[1] < 2:
+        return pd.Series('', index=creative.index)
+    return parts[1].where(is_send, '').fillna('')
+
+
+class GiftCube:
+    """
+    Binned gift statistics by KEYS.
+
+    Attributes
+    ----------
+    keys : pd.DataFrame
+        One row per group, the key values.
+    bins : dict
+        STATS name -> np.array, shape (groups, len(edges) - 1). min and max
+        are nan where a bin is empty.
+    edges : np.array
+        Bin edges; bins are [left, right).
+    """
+    def __init__(self, keys, bins, edges=EDGES):
+        self.keys = keys.reset_index(drop=True)
+        self.bins = bins
+        self.edges = np.asarray(edges, dtype=float)
+
+    @classmethod
+    def from_frame(cls, df, keys=KEYS, edges=EDGES, value_col='value'):
+        """
+        Build the cube in one pass over the gifts. Key columns df doesn't
+        have (e.g. cell, outside a test) are ''.
+        """
+        df = df.assign(**{k: '' for k in keys if k not in df.columns})
+        df = df.dropna(subset=[value_col])
+        grouped = df.groupby(keys, sort=True, dropna=False, observed=True)
+        group = grouped.ngroup().values
+        key_vals = grouped.size().index.to_frame(index=False)
+        values = df[value_col].values.astype(float)
+        num_bins = len(edges) - 1
+        bin_idx = np.clip(np.searchsorted(edges, values, 'right') - 1, 0,
+                          num_bins - 1)
+        cell = group*num_bins + bin_idx
+        size = len(key_vals)*num_bins
+        bins = {'count': np.bincount(cell, minlength=size),
+                'sum': np.bincount(cell, values, minlength=size),
+                'sumsq': np.bincount(cell, values**2, minlength=size),
+                'min': np.full(size, np.inf), 'max': np.full(size, -np.inf)}
+        np.minimum.at(bins['min'], cell, values)
+        np.maximum.at(bins['max'], cell, values)
+        bins['at_min'] = np.bincount(cell, values == bins['min'][cell],
+                                     minlength=size).astype(int)
+        for stat in ['min', 'max']:
+            bins[stat][bins['count'] == 0] = np.nan
+        bins = {k: v.reshape(len(key_vals), num_bins) for k, v in bins.items()}
+        return cls(key_vals, bins, edges)
+
+    def _subset_(self, rows):
+        return GiftCube(self.keys[rows],
+                        {k: v[rows] for k, v in self.bins.items()},
+                        self.edges)
+
+    def select(self, **conditions):
+        """Groups whose keys match, e.g. select(medium=['cpc'], ukgfr=True)"""
+        rows = np.ones(len(self.keys), dtype=bool)
+        for key, vals in conditions.items():
+            rows &= self.keys[key].isin(np.atleast_1d(vals)).values
+        return self._subset_(rows)
+
+    def below(self, limit):
+        """Only gifts under limit, which must be a bin edge"""
+        j = np.flatnonzero(self.edges == limit)
+        if not len(j):
+            raise ValueError("{} isn't a bin edge".format(limit))
+        bins = {k: v[:, :j[0]] for k, v in self.bins.items()}
+        return GiftCube(self.keys, bins, self.edges[:j[0] + 1])
+
+    def rollup(self, by=None):
+        """Sum over the keys not in by (all of them if by is None)"""
+        if by is None:
+            keys = pd.DataFrame(index=[0])
+            group = np.zeros(len(self.keys), dtype=int)
+        else:
+            grouped = self.keys.groupby(list(np.atleast_1d(by)), sort=True,
+                                        dropna=False, observed=True)
+            keys = grouped.size().index.to_frame(index=False)
+            group = grouped.ngroup().values
+        bins = {}
+        for stat, func, init in [('count', np.add, 0), ('sum', np.add, 0),
+                                 ('sumsq', np.add, 0),
+                                 ('min', np.fmin, np.nan),
+                                 ('max', np.fmax, np.nan)]:
+            res = np.full((len(keys), len(self.edges) - 1), init,
+                          dtype=self.bins[stat].dtype)
+            func.at(res, group, self.bins[stat])
+            bins[stat] = res
+        # only gifts at the overall min stay at_min
+        at_min = np.where(self.bins['min'] == bins['min'][group],
+                          self.bins['at_min'], 0)
+        bins['at_min'] = np.zeros_like(bins['count'])
+        np.add.at(bins['at_min'], group, at_min)
+        return GiftCube(keys, bins, self.edges)
+
+    def sizes(self, by=None):
+        """Number of gifts per group of by"""
+        cube = self.rollup(by)
+        res = pd.Series(cube.bins['count'].sum(axis=1), name='count')
+        if by is not None:
+            res.index = pd.MultiIndex.from_frame(cube.keys) if len(
+                np.atleast_1d(by)) > 1 else cube.keys[by]
+        return res
+
+    def hist(self, edges):
+        """Counts on coarser edges, each of which must be a bin edge"""
+        idx = np.searchsorted(self.edges, edges)
+        if not np.array_equal(self.edges[np.clip(idx, 0, len(self.edges)-1)],
+                              edges):
+            raise ValueError("Histogram edges must be cube bin edges")
+        cumu = np.concatenate([np.zeros((len(self.keys), 1)),
+                               self.bins['count'].cumsum(axis=1)], axis=1)
+        return np.diff(cumu[:, idx], axis=1)
+
+    def quantile(self, q):
+        """
+        Approximate quantiles per group (pandas' linear method), shape
+        (groups, len(q)).
+        """
+        q = np.atleast_1d(q)
+        counts = self.bins['count']
+        cumu = counts.cumsum(axis=1)
+        res = np.full((len(counts), len(q)), np.nan)
+        for g in range(len(counts)):
+            if cumu[g, -1] == 0:
+                continue
+            rank = q * (cumu[g, -1] - 1)
+            j = np.searchsorted(cumu[g], rank, 'right')
+            # rank within the bin, less those at its min
+            above = rank - (cumu[g, j] - counts[g, j]) - (
+                self.bins['at_min'][g, j] - 1)
+            frac = above / np.maximum(counts[g, j] - self.bins['at_min'][g, j],
+                                      1)
+            lo, hi = self.bins['min'][g, j], self.bins['max'][g, j]
+            res[g] = lo + np.clip(frac, 0, 1)*(hi - lo)
+        return res
+
+    def describe(self, by=None):
+        """
+        As pd.Series.describe() of the gift values, per group of by, or of
+        all gifts as a one column frame if by is None.
+        """
+        cube = self.rollup(by)
+        count = cube.bins['count'].sum(axis=1)
+        total = cube.bins['sum'].sum(axis=1)
+        mean = total / count
+        var = (cube.bins['sumsq'].sum(axis=1) - total*mean) / (count - 1)
+        quants = cube.quantile([0.25, 0.5, 0.75])
+        res = pd.DataFrame({'count': count, 'mean': mean,
+                            'std': np.sqrt(np.maximum(var, 0)),
+                            'min': np.nanmin(cube.bins['min'], axis=1,
+                                             initial=np.inf),
+                            '25%': quants[:, 0], '50%': quants[:, 1],
+                            '75%': quants[:, 2],
+                            'max': np.nanmax(cube.bins['max'], axis=1,
+                                             initial=-np.inf)})
+        if by is None:
+            return res.T.rename(columns={0: 'value'})
+        res.index = pd.MultiIndex.from_frame(cube.keys)
+        return res
+
+    def save(self, fp=CUBE_FP, source=None):
+        arrays = {'key_' + k: (self.keys[k].values.astype(bool)
+                               if self.keys[k].dtype == bool
+                               else np.asarray(self.keys[k], dtype=str))
+                  for k in self.keys.columns}
+        arrays.update({'bin_' + k: v for k, v in self.bins.items()})
+        np.savez(fp, version=VERSION, edges=self.edges,
+                 source=_signature_(source), **arrays)
+
+    @classmethod
+    def load(cls, fp=CUBE_FP, source=None):
+        """The saved cube; ValueError if stale or built from another source"""
+        with np.load(fp) as arrays:
+            if int(arrays['version']) != VERSION:
+                raise ValueError("Stale gift cube at {}".format(fp))
+            if source is not None and str(arrays['source']) != _signature_(
+                    source):
+                raise ValueError("{} has changed since the cube at {} was "
+                                 "built".format(source, fp))
+            keys = pd.DataFrame({k[4:]: arrays[k] for k in arrays.files
+                                 if k.startswith('key_')})
+            bins = {k[4:]: arrays[k] for k in arrays.files
+                    if k.startswith('bin_')}
+            return cls(keys, bins, arrays['edges'])
+
+
+def _signature_(source):
+    """Size and modified time of the file the cube was built from"""
+    if source is None:
+        return ''
+    stat = os.stat(source)
+    return '{}:{}:{}'.format(source, stat.st_size, int(stat.st_mtime))
+
+
+def violins(ax, cube, by, order=None, hue=None, edges=range(0, 101, 5),
+            colors=('#1d1a1c', '#04923e'), scale='width', width=0.8):
+    """
+    Horizontal violin-like plots drawn from the cube: a histogram of gifts
+    mirrored about each category of by, or with hue (e.g. 'ukgfr') the two
+    values of hue as the lower and upper halves, as seaborn's split violins.
+
+    Parameters
+    ----------
+    ax : matplotlib axes
+    by : string
+        Key for the y axis, e.g. 'medium'.
+    order : list
+        Values of by to show, top down. Defaults to all.
+    edges : list
+        Histogram edges, which must be cube bin edges.
+    scale : string
+        'width': each violin is as wide as the others; 'count': widths are
+        in proportion to the number of gifts.
+    """
+    keys = [by] if hue is None else [by, hue]
+    cube = cube.rollup(keys)
+    if order is None:
+        order = sorted(cube.keys[by].unique())
+    hues = [None] if hue is None else sorted(cube.keys[hue].unique())
+    edges = np.asarray(list(edges), dtype=float)
+    counts = cube.hist(edges)
+    dens = counts / np.diff(edges)
+    peak = dens.max() if len(dens) and scale == 'count' else None
+    for i, cat in enumerate(order):
+        for h, hue_val in enumerate(hues):
+            rows = cube.keys[by] == cat
+            if hue is not None:
+                rows = rows & (cube.keys[hue] == hue_val)
+            rows = rows.values
+            if not rows.any():
+                continue
+            d = dens[rows].sum(axis=0)
+            if not d.max():
+                continue
+            half = d / (peak or d.max()) * width / 2
+            half = np.r_[half, half[-1]]
+            if hue is None:
+                lower, upper = i - half, i + half
+            elif h == 0:
+                lower, upper = i - half, np.full_like(half, i)
+            else:
+                lower, upper = np.full_like(half, i), i + half
+            ax.fill_between(edges, lower, upper, step='post',
+                            color=colors[h % len(colors)],
+                            label=(str(hue_val) if i == 0 and hue is not None
+                                   else None))
+    ax.set_yticks(range(len(order)))
+    ax.set_yticklabels(order)
+    ax.set_ylim(len(order) - 0.5, -0.5)
+    ax.set_ylabel(by)
+    ax.set_xlabel('value')
+    return ax
+
+
+def get_cube(build, fp=CUBE_FP, source=None, outputs=()):
+    """
+    The cube saved at fp, or build() it and save it if there is none, it's
+    stale, source has changed since it was built, or one of the other files
+    build() writes (outputs) is missing.
+    """
+    try:
+        if not all(os.path.exists(out) for out in outputs):
+            raise OSError('missing outputs')
+        return GiftCube.load(fp, source)
+    except (OSError, ValueError, KeyError):
+        cube = build()
+        if os.path.isdir(os.path.dirname(fp) or '.'):
+            cube.save(fp, source)
+        return cube
+
+
+# Benchmark
+if __name__ == "__main__":
+    import tempfile
+    import time
+    rng = np.random.default_rng(1)
+    num = 2000000
+    amounts = np.array([3, 5, 10, 15, 20, 25, 30, 50, 100, 250])
+    gifts = pd.DataFrame({
+        'value': np.where(rng.random(num) < 0.8,
+                          rng.choice(amounts, num),
+                          np.round(rng.lognormal(3, 1, num), 2)),
+        'month': rng.choice(['2020-{:02d}'.format(m) for m in range(1, 13)],
+                            num),
+        'medium': rng.choice(['Email', 'cpc', 'Social Ad', 'Offline'], num),
+        'ukgfr': rng.random(num) < 0.3,
+        'sendnum': rng.choice(['', '1', '2', '3'], num),
+        'cell': ''})
+    tic = time.perf_counter()
+    cube = GiftCube.from_frame(gifts)
+    print("Built {} group cube from {} gifts in {:.2f}s".format(
+        len(cube.keys), num, time.perf_counter() - tic))
+    with tempfile.TemporaryDirectory() as tmp:
+        fp = os.path.join(tmp, 'GiftCube.npz')
+        cube.save(fp)
+        tic = time.perf_counter()
+        cube = GiftCube.load(fp)
+        res = cube.select(medium=['cpc', 'Email']).describe()
+        print("Loaded and described in {:.3f}s".format(
+            time.perf_counter() - tic))
+    print(pd.concat([res, gifts[gifts['medium'].isin(['cpc', 'Email'])]
+                     [['value']].describe()], axis=1, keys=['cube', 'raw']))
+    res = cube.below(100).describe('medium')
+    raw = gifts[gifts['value'] < 100].groupby('medium')['value'].describe()
+    print("Max abs diff by medium, under £100:\n{}".format(
+        (res.reset_index(drop=True) - raw.reset_index(drop=True)).abs().max()))
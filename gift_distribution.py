@@ -5,16 +5,16 @@ Created on Wed Jun 10 16:13:37 2020
 @author: SWannell
 """
 
-import pandas as pd
 import matplotlib.pyplot as plt; plt.style.use('ggplot')
 import matplotlib.ticker as mtick
 import seaborn as sns
 
-lbl = pd.read_csv('AmendedData\\LBL.csv')
+from lbl_store import read_table
+
+lbl = read_table('LBL', columns=['value', 'cell'],
+                 filters=[('value', '<=', 100)])
 cells = ['ctrl', 'test']
 colours = ['#1d1a1c', '#ee2a24']
-lbl = lbl[['value', 'cell']]
-lbl = lbl[lbl['value'] <= 100]
 
 bins = [0, 5, 10.01, 25, 30.01, 50, 60.01, 100]
 
@@ -10,10 +10,12 @@ import numpy as np
 import math
 from scipy.stats import chi2_contingency
 
-lbl = pd.read_csv('AmendedData\\LBL.csv')
+from lbl_store import read_table, write_table
+
+lbl = read_table('LBL', columns=['id', 'value', 'optin', 'giftaid', 'appeal',
+                                 'cell', 'warm'])
 
 # Format, check
-lbl = lbl[['id', 'value', 'optin', 'giftaid', 'appeal', 'cell', 'warm']]
 assert len(lbl['optin'].dropna()) + len(lbl['warm'].dropna()) == len(lbl)
 lbl['warm'] = lbl['warm'].fillna(False).replace('OptInNotReshown', True)
 
@@ -62,6 +64,7 @@ def ci_walters(obs,col=0,z=1.96):
 
 for k, metric_df in guardrails.items():
     metric_df.to_csv('AmendedData\\LBL_{}.csv'.format(k))
+    write_table(metric_df.reset_index(), 'LBL_' + k, date_col=None)
     [ctrl_tot, test_tot] = metric_df['total'].values
     [ctrl_conv, test_conv] = metric_df['count'].values
     ctrl_r = ctrl_conv/ctrl_tot * 100
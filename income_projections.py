@@ -7,10 +7,12 @@ Created on Thu Jun 11 14:51:09 2020
 
 import pandas as pd
 
-lbl = pd.read_csv('AmendedData\\LBL.csv')
-lbl = lbl[lbl['value'] <= 100]
+from lbl_store import read_table
 
-em = pd.read_csv('AmendedData\\LBL_emailable.csv', index_col=0)
+lbl = read_table('LBL', columns=['cell', 'value'],
+                 filters=[('value', '<=', 100)])
+
+em = read_table('LBL_emailable').set_index('cell')
 em_pct = em['count'] / em['total']
 
 modest = 12.44
@@ -7,47 +7,64 @@ Created on Wed May 13 12:10:54 2020
 
 import pandas as pd
 import seaborn as sns
-import numpy as np
 import matplotlib.pyplot as plt; plt.style.use('ggplot')
 import matplotlib.ticker as mtick
 
-# Munge SGLBL
+from gift_cube import GiftCube, get_cube, send_number, violins
 
-sglbl = pd.read_csv('RawData\\old_sglbl.csv')
+# Munge SGLBL, and pre-aggregate it into the gift cube: the plots and
+# describes below render from the cube, which is only rebuilt when the raw
+# file changes or a file munge() writes is missing
 
-for col in sglbl.columns:
-    if "Date" in col:
-        sglbl[col] = pd.to_datetime(sglbl[col], dayfirst=True)
+raw_fp = 'RawData\\old_sglbl.csv'
+sglbl_fp = 'AmendedData\\old_sglbl.csv'
+cpclbl_fp = 'AmendedData\\cpclbl.csv'
 
-sglbl.columns = ['date', 'settle_date', 'value', 'id', 'afd', 'email',
-                 'privacy',
-                 'giftaid', 'appeal', 'sorp', 'platform', 'status',
-                 'sourcecode', 'campaign', 'source', 'medium', 'creative',
-                 'audience', 'os', 'os_version', 'browser', 'browser_version',
-                 'response_code', 'trans_uuid']
 
-sglbl = sglbl.loc[:, ['date', 'value', 'id', 'medium', 'creative', 'sorp']]
-sglbl['month'] = pd.DatetimeIndex(sglbl["date"]).strftime('%Y-%m')
-sglbl.set_index('date', inplace=True)
-sglbl.isna().sum()  # lots of NA in Medium
-sglbl['medium'].fillna('Other', inplace=True)
-sglbl.to_csv('AmendedData\\old_sglbl.csv')
+def munge():
+    sglbl = pd.read_csv(raw_fp)
 
-# Why is email so high for UKGFR? Investigate using creative
+    for col in sglbl.columns:
+        if "Date" in col:
+            sglbl[col] = pd.to_datetime(sglbl[col], dayfirst=True)
 
-# Make GFR and non-GFR DFs
+    sglbl.columns = ['date', 'settle_date', 'value', 'id', 'afd', 'email',
+                     'privacy',
+                     'giftaid', 'appeal', 'sorp', 'platform', 'status',
+                     'sourcecode', 'campaign', 'source', 'medium', 'creative',
+                     'audience', 'os', 'os_version', 'browser',
+                     'browser_version', 'response_code', 'trans_uuid']
 
-sglbl['ukgfr'] = sglbl['sorp'].str.contains('P6269')
+    sglbl = sglbl.loc[:, ['date', 'value', 'id', 'medium', 'creative',
+                          'sorp']]
+    sglbl['month'] = pd.DatetimeIndex(sglbl["date"]).strftime('%Y-%m')
+    sglbl.set_index('date', inplace=True)
+    sglbl.isna().sum()  # lots of NA in Medium
+    sglbl['medium'] = sglbl['medium'].fillna('Other')
+    sglbl.to_csv(sglbl_fp)
 
-nonsmall = sglbl.pivot_table(values='value', index='medium',
-                             aggfunc=np.count_nonzero)
-nonsmall = nonsmall[nonsmall['value'] > 50].index
+    # Why is email so high for UKGFR? Investigate using creative
+    sglbl['ukgfr'] = sglbl['sorp'].str.contains('P6269', na=False)
 
-sg_nonsmall = sglbl[sglbl['medium'].isin(nonsmall)]
-sg_nonsmall = sg_nonsmall[sg_nonsmall['value'] < 100]
+    # For t-test trial
+    sglbl[(sglbl['medium'] == 'cpc') & (sglbl['value'] < 100)].to_csv(
+        cpclbl_fp)
 
-ukgfr_nonsmall = sg_nonsmall[sg_nonsmall['ukgfr'] == True]
-nonuk_nonsmall = sg_nonsmall[sg_nonsmall['ukgfr'] == False]
+    sglbl['sendnum'] = send_number(sglbl['medium'], sglbl['creative'])
+    return GiftCube.from_frame(sglbl)
+
+
+cube = get_cube(munge, source=raw_fp, outputs=[sglbl_fp, cpclbl_fp])
+
+# Make GFR and non-GFR cubes
+
+nonsmall = cube.sizes('medium')
+nonsmall = list(nonsmall[nonsmall > 50].index)
+
+sg_nonsmall = cube.select(medium=nonsmall).below(100)
+
+ukgfr_nonsmall = sg_nonsmall.select(ukgfr=True)
+nonuk_nonsmall = sg_nonsmall.select(ukgfr=False)
 
 # =============================================================================
 # Two-facet plot of UK GFR gift distribution, vs not
@@ -57,8 +74,8 @@ fig, axs = plt.subplots(1, 2, figsize=(14, 7), sharey=True)
 
 plt.suptitle('2020 gift distribution by medium', fontsize=20)
 
-sns.violinplot(x='value', y='medium', data=ukgfr_nonsmall, ax=axs[0],
-               order=nonsmall)
+violins(axs[0], ukgfr_nonsmall, 'medium', order=nonsmall,
+        colors=['#e24a33'])
 currfmt = mtick.StrMethodFormatter('£{x:,.0f}')
 axs[0].xaxis.set_major_formatter(currfmt)
 axs[0].get_xaxis().set_minor_locator(mtick.AutoMinorLocator())
@@ -66,8 +83,8 @@ axs[0].grid(b=True, which='minor', color='w', axis='x', linewidth=1.0)
 axs[0].set_title('UK GFR gifts')
 axs[0].set_xlim((0, 100))
 
-sns.violinplot(x='value', y='medium', data=nonuk_nonsmall, ax=axs[1],
-               order=nonsmall)
+violins(axs[1], nonuk_nonsmall, 'medium', order=nonsmall,
+        colors=['#e24a33'])
 axs[1].xaxis.set_major_formatter(currfmt)
 axs[1].get_xaxis().set_minor_locator(mtick.AutoMinorLocator())
 axs[1].grid(b=True, which='minor', color='w', axis='x', linewidth=1.0)
@@ -80,11 +97,10 @@ plt.savefig('Outputs\\2020_gift_values_by_channel.png')
 # =============================================================================
 
 colors = ["#1d1a1c", "#04923e"]
-sns.set_palette(sns.color_palette(colors))
 
 fig, ax = plt.subplots(1, 1, figsize=(7, 7))
-sns.violinplot(x='value', y='medium', hue='ukgfr', split=True, scale='count',
-               data=sg_nonsmall, ax=ax, order=nonsmall, cut=0)
+violins(ax, sg_nonsmall, 'medium', hue='ukgfr', order=nonsmall,
+        colors=colors, scale='count')
 ax.xaxis.set_major_formatter(currfmt)
 ax.get_xaxis().set_minor_locator(mtick.AutoMinorLocator())
 ax.grid(b=True, which='minor', color='w', axis='x', linewidth=1.0)
@@ -98,25 +114,15 @@ plt.savefig('Outputs\\2020_gift_values_by_channel_split.png')
 # One facet version for just email
 # =============================================================================
 
-sg_email_nonsmall = sglbl[sglbl['medium'] == 'Email']
-sg_email_nonsmall = sg_email_nonsmall[sg_email_nonsmall['value'] < 100]
-sg_email_nonsmall = sg_email_nonsmall[sg_email_nonsmall['creative'].str.startswith('Donate', na=False)]
-
-sg_email_creative = sg_email_nonsmall['creative'].str.split('_',
-                                     expand=True).loc[:, '0':'1']
-sg_email_creative.drop(0, axis=1, inplace=True)
-sg_email_creative.columns = ['sendnum']
-sg_email_nonsmall['sendnum'] = sg_email_creative['sendnum'].values
-
-sendnumlist = sg_email_nonsmall['sendnum'].value_counts()
+sg_email_nonsmall = cube.select(medium='Email').below(100)
+sendnumlist = sg_email_nonsmall.sizes('sendnum').drop('', errors='ignore')
 sendnumlist = sendnumlist[sendnumlist > 100]
-sendnumlist = sendnumlist.index
+sendnumlist = list(sendnumlist.index)
 
-sg_email_nonsmall = sg_email_nonsmall[sg_email_nonsmall['sendnum'].isin(sendnumlist)]
+sg_email_nonsmall = sg_email_nonsmall.select(sendnum=sendnumlist)
 
 figem, axem = plt.subplots(1, 1, figsize=(14, 7))
-sns.violinplot(x='value', y='sendnum', hue='ukgfr', split=True,
-               data=sg_email_nonsmall, ax=axem, cut=0)
+violins(axem, sg_email_nonsmall, 'sendnum', hue='ukgfr', colors=colors)
 ax.xaxis.set_major_formatter(currfmt)
 ax.get_xaxis().set_minor_locator(mtick.AutoMinorLocator())
 ax.grid(b=True, which='minor', color='w', axis='x', linewidth=1.0)
@@ -124,15 +130,16 @@ ax.set_title('2020 gifts by send number', fontsize=20)
 ax.set_xlim((0, 100))
 plt.savefig('Outputs\\2020_gift_values_by_email_sendnum_split.png')
 
-sg_email_nonsmall_ukgfr = sg_email_nonsmall[sg_email_nonsmall['ukgfr'] == True]
+sg_email_nonsmall_ukgfr = sg_email_nonsmall.select(ukgfr=True)
 
-ukgfr_sendnums = sg_email_nonsmall_ukgfr['sendnum'].value_counts().index
+ukgfr_sendnums = sg_email_nonsmall_ukgfr.sizes('sendnum').sort_values(
+    ascending=False).index
 
 fignum, axnum = plt.subplots(1, 2, figsize=(10, 5), sharey=True)
+bins = list(range(0, 100, 5))
 for i, send in enumerate(ukgfr_sendnums):
-    df = sg_email_nonsmall_ukgfr
-    df = df[df['sendnum'] == send]
-    df.plot.hist(ax=axnum[i], bins=range(0, 100, 5), color='#ee2a24')
+    counts = sg_email_nonsmall_ukgfr.select(sendnum=send).rollup().hist(bins)
+    axnum[i].hist(bins[:-1], bins=bins, weights=counts[0], color='#ee2a24')
     axnum[i].set_title(send)
 plt.suptitle('Gift values for UK GFR emails', fontsize=20)
 plt.savefig('Outputs\\UKGFR_gift_values_by_sendnum_split.png')
@@ -152,12 +159,6 @@ ax.set_title('2018-10 cpc gift values (during Indonesia)')
 ax.set_xlim((0, 100))
 plt.savefig('Outputs\\Indonesia_gift_values_cpc.png')
 
-# =============================================================================
-# For t-test trial
-# =============================================================================
-
-sg_nonsmall[sg_nonsmall['medium'] == 'cpc'].to_csv('AmendedData\\cpclbl.csv')
-
 # =============================================================================
 # For Rach's Q about ppc median gift
 # =============================================================================
@@ -166,15 +167,17 @@ sg_nonsmall[sg_nonsmall['medium'] == 'cpc'].to_csv('AmendedData\\cpclbl.csv')
 # segment = 'Email'
 segment = 'Social Ad'
 
-ukgfr_segment = sglbl[(sglbl['medium']==segment) & (sglbl['ukgfr']==True)]
+ukgfr_segment = cube.select(medium=segment, ukgfr=True)
 
 ukgfr_segment.describe()
 
 figseg, axseg = plt.subplots(1, 1, figsize=(8, 5))
-ukgfr_segment['value'].hist(bins=list(range(0, 100, 5)) + [100, 10000],
-         color='#ee2a24', ax=axseg, edgecolor='gray', linewidth=1)
+bins = list(range(0, 100, 5)) + [100, 10000]
+counts = ukgfr_segment.rollup().hist(bins)
+axseg.hist(bins[:-1], bins=bins, weights=counts[0], color='#ee2a24',
+           edgecolor='gray', linewidth=1)
 axseg.set_xlim((0, 200))
-ukgfr_segment_max = ukgfr_segment['value'].max()
+ukgfr_segment_max = ukgfr_segment.describe().loc['max', 'value']
 seg_annot = "This bin is gifts from £100-£{:,.0f}".format(ukgfr_segment_max)
 axseg.annotate(seg_annot, (100, 170))
 axseg.set_title('Gift values for UK GFR {}'.format(segment))
@@ -186,5 +189,5 @@ plt.savefig('Outputs\\ukgfr_gift_values_{}.png'.format(seg_strip))
 # For information quotient for t-test
 # =============================================================================
 
-email_and_cpc = sglbl[sglbl['medium'].isin(['cpc', 'Email'])]
+email_and_cpc = cube.select(medium=['cpc', 'Email'])
 email_and_cpc.describe().to_csv('AmendedData\\in_target_group_describe.csv')
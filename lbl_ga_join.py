@@ -5,52 +5,58 @@ Created on Tue Mar  3 15:21:45 2020
 @author: SWannell
 """
 
+import io
+import os
 import pandas as pd
 
+from lbl_store import has_table, read_table, write_table
+from reconcile import print_report, reconcile
+
 start_date = '20200520'
 end_date = '20200609'  # would be grab start/end dates from a log file?
 
 # Set file paths
 gaid_fp = 'AmendedData\\GADataTrans{}-{}.csv'.format(start_date, end_date)
-sglbl_fp = 'AmendedData\\sglbl.csv'
+lbl_fp = 'AmendedData\\LBL.csv'
 # rglbl_fp = 'AmendedData\\RGLBL.csv'
 
+# Only GA IDs not yet in the joined LBL are joined, against just their rows
+# of the munged LBL store, and appended: the IDs already joined are the
+# watermark. Set full_refresh to rejoin everything.
+full_refresh = False
+incremental = not full_refresh and has_table('LBL') and os.path.exists(lbl_fp)
+
 # Read in data
 gaid = pd.read_csv(gaid_fp)
-sglbl = pd.read_csv(sglbl_fp)
-
-# rglbl = pd.read_csv(rglbl_fp)
-# for df in [trans, sglbl, rglbl]:
-for df in [gaid, sglbl]:
-    df.set_index('id', inplace=True)
-
+gaid.set_index('id', inplace=True)
 gaid = gaid[['cell']]
-print('Test IDs in GA: {}'.format(len(set(gaid.index))))
-
-df_sg = sglbl.join(gaid)
-print('IDs in SGLBL and/or GA: {}'.format(len(set(df_sg.index))))
 
-df_sg = df_sg.dropna(subset=['cell'])
-print('Test IDs in SGLBL and GA: {}'.format(len(set(df_sg.index))))
-
-num_rgs = len(gaid[gaid.index.str.startswith('IDD')])
-
-test_sg_ids = set(df_sg.index)
-test_rg_ids = set(gaid[gaid.index.str.startswith('IDD')].index)
-test_ids = test_sg_ids.union(test_rg_ids)
+joined = pd.Index(read_table('LBL', columns=['id'])['id'] if incremental
+                  else [])
+new_gaid = gaid[~gaid.index.isin(joined)]
+sglbl = read_table('sglbl', filters=[('id', 'in', list(new_gaid.index))])
+sglbl.set_index('id', inplace=True)
 
-print('Test IDs: {}\nGA IDs: {}'.format(len(test_ids), len(gaid.index)))
-
-mismatch_ids = test_ids.symmetric_difference(set(gaid.index))
+# rglbl = pd.read_csv(rglbl_fp)
 
-try:
-    assert len(mismatch_ids) == 0, "There are  IDs in just GA but not LBL"
-except AssertionError as msg:
-    print(msg)
-    missing_testids = [tid for tid in gaid.index if tid not in test_ids]
-    print("Missing from lbl:", missing_testids)
-    missing_gaids = [tid for tid in test_ids if tid not in gaid.index]
-    print("Missing from GA:", missing_gaids)
+# one hashed pass over both ID lists, rather than set/list lookups: every
+# LBL gift in the test window (so those not in the test show as LBL only),
+# plus the matched ones from outside it
+window = pd.Index(read_table(
+    'sglbl', columns=['id'],
+    start=pd.Timestamp(start_date).strftime('%Y-%m-%d'),
+    end=pd.Timestamp(end_date).strftime('%Y-%m-%d'))['id'])
+matched = joined.append(sglbl.index)
+report = reconcile(gaid.index,
+                   window.append(matched[~matched.isin(window)]))
+print_report(report)
+if not report['ok']:
+    print("There are IDs in just GA but not LBL, or duplicated IDs")
+
+df_sg = sglbl.join(new_gaid)
+df_sg = df_sg.dropna(subset=['cell'])
+print('Test IDs in SGLBL and GA: {} ({} new)'.format(len(joined) + len(df_sg),
+                                                    len(df_sg)))
 
 # RG merge
 #df_rg = rglbl.join(trans)
@@ -60,13 +66,25 @@ except AssertionError as msg:
 
 # Final LBL
 # lbl = df_sg.append(df_rg)
-lbl = df_sg
-lbl.to_csv('AmendedData\\LBL.csv')
+# via the csv text, so values and flags parse as they always have; text,
+# like source codes, stays text
+lbl_csv = df_sg.to_csv(header=not incremental, date_format='%d/%m/%Y %H:%M')
+lbl_text = {col: str for col in ['id'] + list(df_sg.columns)
+            if col not in ['value', 'optin', 'giftaid']}
+if len(df_sg) or not incremental:
+    with open(lbl_fp, 'a' if incremental else 'w', newline='') as out:
+        out.write(lbl_csv)
+    lbl_typed = pd.read_csv(io.StringIO(lbl_csv),
+                            header=None if incremental else 0,
+                            names=['id'] + list(df_sg.columns),
+                            dtype=lbl_text)
+    lbl_typed['date'] = pd.to_datetime(lbl_typed['date'], dayfirst=True)
+    write_table(lbl_typed, 'LBL', append=incremental)
 
 #sglbl['warm'] = sglbl['warm'].fillna(False).replace('OptInNotReshown', True)
 
 # Contingency
-df = lbl[['optin', 'giftaid', 'cell']]
+df = read_table('LBL', columns=['optin', 'giftaid', 'cell'])
 results = df.groupby('cell').sum()
 totals = gaid.groupby('cell').sum()
 cont = totals.join(results)
@@ -7,6 +7,10 @@ Created on Tue Mar  3 15:30:27 2020
 
 import pandas as pd
 import os
+import shutil
+
+from lbl_store import (get_watermark, has_table, read_table, set_watermark,
+                       write_table)
 
 # =============================================================================
 # Munge single giving data, remove PII
@@ -55,20 +59,85 @@ import os
 # Munge AllLBL, remove PII, get SGLBL
 # =============================================================================
 
+# Read in chunks, parsing only the columns kept, so memory stays bounded by
+# chunksize however much history the export covers. The export is the full
+# history each day, so after the first run only rows from the watermark (the
+# latest date munged, less a day's lookback for late rows) on are kept, and
+# those already in the store are dropped: the store, sglbl.csv and the join
+# then grow with the new rows only. The new rows are held until they've all
+# been read, a day or so of gifts, so the file and store get them together.
+# Set full_refresh to rebuild from scratch, e.g. if old rows have been
+# amended.
 lbl_raw_fp = 'RawData\\AllLineByLine.csv'
-lbl = pd.read_csv(lbl_raw_fp)
+lbl_fp = 'AmendedData\\sglbl.csv'
+chunksize = 100000
+lookback = pd.Timedelta(1, 'D')
+full_refresh = False
 
-lbl = lbl[['Date_Response', 'Payment_Reference', 'Response_Value',
-           'Email_Opt_In', 'Gift_Aid_Declaration', 'Appeal_Name',
-           'Platform', 'Campaign_Approach_Code', 'Campaign', 'Source',
-           'Medium', 'Creative', 'Audience_Ad_Group', 'Response_Code']]
-lbl.columns = ['date', 'id', 'value', 'optin', 'giftaid', 'appeal',
-               'platform', 'sourcecode', 'campaign', 'source',
-               'medium', 'creative', 'audience', 'warm']
-lbl.dropna(subset=['id'], inplace=True)
-lbl = lbl[~lbl['id'].str.startswith('IDD')]
-lbl = lbl.set_index('id')
-os.remove(lbl_raw_fp)
+lbl_cols = {'Date_Response': 'date', 'Payment_Reference': 'id',
+            'Response_Value': 'value', 'Email_Opt_In': 'optin',
+            'Gift_Aid_Declaration': 'giftaid', 'Appeal_Name': 'appeal',
+            'Platform': 'platform', 'Campaign_Approach_Code': 'sourcecode',
+            'Campaign': 'campaign', 'Source': 'source', 'Medium': 'medium',
+            'Creative': 'creative', 'Audience_Ad_Group': 'audience',
+            'Response_Code': 'warm'}
+# text read as text, e.g. source codes are mostly but not all numbers
+lbl_dtypes = {col: str for col in lbl_cols}
+lbl_dtypes['Response_Value'] = 'float32'
 
-#sglbl_new_fp = fp.format('AmendedData')
-lbl.to_csv('AmendedData\\sglbl.csv')
+watermark = get_watermark('sglbl')
+incremental = (not full_refresh and watermark is not None and
+               has_table('sglbl') and os.path.exists(lbl_fp))
+if incremental:
+    since = pd.Timestamp(watermark['date']) - lookback
+    seen = pd.Index(read_table('sglbl', columns=['id'],
+                               start=since.strftime('%Y-%m-%d'))['id'])
+    latest = pd.Timestamp(watermark['date'])
+else:
+    set_watermark('sglbl', None)
+    latest = None
+
+rows_read, rows_kept, new_rows = 0, 0, []
+with open(lbl_fp + '.tmp', 'w', newline='') as out:
+    for lbl in pd.read_csv(lbl_raw_fp, usecols=list(lbl_cols),
+                           dtype=lbl_dtypes, chunksize=chunksize):
+        rows_read += len(lbl)
+        lbl = lbl[list(lbl_cols)]
+        lbl.columns = list(lbl_cols.values())
+        lbl['date'] = pd.to_datetime(lbl['date'], dayfirst=True)
+        lbl = lbl.dropna(subset=['id'])
+        lbl = lbl[~lbl['id'].str.startswith('IDD')]
+        if incremental:
+            lbl = lbl[(lbl['date'] >= since) & ~lbl['id'].isin(seen)]
+        if len(lbl) == 0:
+            continue
+        day = lbl['date'].max()
+        latest = day if latest is None else max(latest, day)
+        lbl = lbl.set_index('id')
+        lbl.to_csv(out, header=(rows_kept == 0 and not incremental),
+                   date_format='%d/%m/%Y %H:%M')
+        if incremental:
+            new_rows.append(lbl.reset_index())
+        else:
+            write_table(lbl.reset_index(), 'sglbl', append=rows_kept > 0)
+        rows_kept += len(lbl)
+    if rows_kept == 0 and not incremental:
+        # nothing kept: still replace the file and table, with no rows
+        empty = pd.DataFrame(columns=list(lbl_cols.values())).set_index('id')
+        empty.to_csv(out)
+        write_table(empty.reset_index(), 'sglbl')
+if incremental:
+    # new rows go on the end of the existing file, and only then into the
+    # store: the store is what the next run dedupes against, so a failed
+    # run mustn't leave rows there that the file never got
+    with open(lbl_fp, 'a', newline='') as out, open(lbl_fp + '.tmp') as new:
+        shutil.copyfileobj(new, out)
+    os.remove(lbl_fp + '.tmp')
+    if len(new_rows):
+        write_table(pd.concat(new_rows), 'sglbl', append=True)
+else:
+    os.replace(lbl_fp + '.tmp', lbl_fp)
+if latest is not None:
+    set_watermark('sglbl', {'date': latest.isoformat()})
+os.remove(lbl_raw_fp)
+print('LBL rows read: {}, new rows kept: {}'.format(rows_read, rows_kept))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated power of the average gift t-test for shifts in the prompt
+distribution.
+
+Each replicate draws the number of gifts at each prompt value for a cell
+from a multinomial, so means and variances come straight from the counts.
+Every lift x cell volume x replicate is drawn and tested in one vectorised
+pass.
+"""
+
+import numpy as np
+from scipy.stats import t
+
+
+def shifted_p(p, lifts, shift=(-1, 0.5, 0.5)):
+    """
+    Prompt probabilities after moving lift x shift of the probability mass,
+    e.g. the default takes lift from the lowest prompt and splits it over
+    the other two.
+
+    Returns
+    -------
+    p : np.array
+        Shape (lifts, prompts).
+    """
+    res = np.asarray(p, dtype=float) + np.outer(lifts, shift)
+    if (res < 0).any() or (res > 1).any():
+        raise ValueError("Lift too large: prompt probabilities leave [0, 1]")
+    return res
+
+
+def _moments_(counts, prompts, vol):
+    """Mean and sample variance of gifts, from counts per prompt value"""
+    mean = counts @ prompts / vol
+    var = (counts @ prompts**2 - vol*mean**2) / (vol - 1)
+    return mean, var
+
+
+def simulate_power(prompts, ctrl_p, test_p, vols, replicates=2000,
+                   alpha=0.05, seed=1234, test_prompts=None):
+    """
+    Empirical power of the two-sided t-test, per test distribution and
+    cell volume.
+
+    Parameters
+    ----------
+    prompts : list
+        Prompt values (gift amounts) for the control cell.
+    ctrl_p : list
+        Control probability of each prompt value.
+    test_p : np.array
+        Test probabilities, shape (lifts, prompts), e.g. from shifted_p.
+    vols : list
+        Gifts per cell.
+    test_prompts : list
+        Prompt values for the test cell, if different from control.
+
+    Returns
+    -------
+    res : dict
+        'power': np.array, shape (lifts, vols).
+        'mean_lift': np.array, shape (lifts,) - the relative lift in the
+        expected mean gift of each test distribution.
+    """
+    rng = np.random.default_rng(seed)
+    prompts = np.asarray(prompts, dtype=float)
+    test_prompts = prompts if test_prompts is None else np.asarray(
+        test_prompts, dtype=float)
+    test_p = np.atleast_2d(test_p)
+    vols = np.asarray(vols)
+    vol = vols[None, :, None]  # (1, vols, 1)
+    # control counts are shared across lifts
+    ctrl = rng.multinomial(vols[:, None], ctrl_p,
+                           size=(len(vols), replicates))
+    test = rng.multinomial(vol, test_p[:, None, None, :],
+                           size=(len(test_p), len(vols), replicates))
+    ctrl_mean, ctrl_var = _moments_(ctrl[None], prompts, vol)
+    test_mean, test_var = _moments_(test, test_prompts, vol)
+    # Student's t with equal n, as ttest_ind_from_stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stat = (test_mean - ctrl_mean) / np.sqrt((ctrl_var + test_var) /
+                                                   vol)
+    p_val = 2*t.sf(np.abs(t_stat), 2*vol - 2)
+    mean_lift = (test_p @ test_prompts) / (np.dot(ctrl_p, prompts)) - 1
+    return {'power': (p_val < alpha).mean(axis=2), 'mean_lift': mean_lift}
+
+
+def empirical_mde(lifts, pwr, target=0.8):
+    """
+    Smallest lift reaching the target power, per cell volume, interpolated
+    between grid points. NaN where the grid never reaches it.
+
+    Parameters
+    ----------
+    lifts : np.array
+        Lift grid, increasing.
+    pwr : np.array
+        Power, shape (lifts, vols).
+    """
+    res = np.full(pwr.shape[1], np.nan)
+    for j in range(pwr.shape[1]):
+        above = np.flatnonzero(pwr[:, j] >= target)
+        if len(above) == 0:
+            continue
+        k = above[0]
+        if k == 0:
+            res[j] = lifts[0]
+        else:
+            res[j] = np.interp(target, pwr[k-1:k+1, j], lifts[k-1:k+1])
+    return res
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    lifts = np.arange(0, 0.21, 0.01)
+    vols = [250, 500, 1000, 2000]
+    tic = time.perf_counter()
+    res = simulate_power([5, 25, 50], [0.25, 0.375, 0.375],
+                         shifted_p([0.25, 0.375, 0.375], lifts), vols,
+                         replicates=5000)
+    toc = time.perf_counter() - tic
+    print("{} lifts x {} vols x 5000 replicates in {:.2f}s".format(
+        len(lifts), len(vols), toc))
+    print("MDE (prompt shift) at 80% power:",
+          dict(zip(vols, np.round(empirical_mde(lifts, res['power']),
+                                   3).tolist())))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Run the test progress check (see README) as one pipeline, skipping any
+script whose inputs and code haven't changed since its last run.
+
+Each stage declares the files it reads and writes. A stage depends on the
+stages that write its inputs, and stages whose dependencies are done run
+in parallel. A stage is skipped if the hash of its inputs and code matches
+the one recorded after its last successful run, and its outputs exist. A
+stage with missing inputs blocks the stages that depend on it.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+
+def _yesterday_():
+    return (datetime.now() - timedelta(1)).strftime('%Y-%m-%d')
+
+
+def _store_(name):
+    """Files of a table in the parquet store (see lbl_store.py)"""
+    return 'AmendedData\\Store\\{}\\**\\*.parquet'.format(name)
+
+
+stages = {
+    'lbl_munge': {
+        'code': ['lbl_munge.py', 'lbl_store.py'],
+        'inputs': ['RawData\\AllLineByLine.csv'],
+        'consumes_inputs': True,  # deletes the raw export once munged
+        'outputs': ['AmendedData\\sglbl.csv', _store_('sglbl'),
+                    'AmendedData\\Watermarks.json']},
+    'FetchData': {
+        'code': ['FetchData.py', 'GAAccess.py', 'ga_cache.py',
+                 'cumulative.py', 'sheet_ingest.py', 'lbl_store.py'],
+        'inputs': [],
+        'key': _yesterday_,  # GA has one more day of data each day
+        'outputs': ['AmendedData\\GADataTrans*.csv',
+                    'AmendedData\\CumuDatactrl.pkl',
+                    'AmendedData\\CumuDatatest.pkl'],
+        'interactive': True},  # asks for a GA token
+    'lbl_ga_join': {
+        'code': ['lbl_ga_join.py', 'reconcile.py', 'lbl_store.py'],
+        'inputs': [_store_('sglbl'), 'AmendedData\\GADataTrans*.csv'],
+        'outputs': ['AmendedData\\LBL.csv', _store_('LBL'),
+                    'AmendedData\\LBLcontingency.csv']},
+    'DoSeqAnalysis': {
+        'code': ['DoSeqAnalysis.py', 'SeqAnalysis.py', 'boundary_table.py',
+                 'gs_boundaries.py'],
+        'inputs': ['AmendedData\\CumuDatactrl.pkl',
+                   'AmendedData\\CumuDatatest.pkl'],
+        'outputs': ['Outputs\\Results_Target1000.png',
+                    'Outputs\\CTR_by_day.png']},
+    'seq_analysis_ttest': {
+        'code': ['seq_analysis_ttest.py', 'SeqTTest.py', 'SeqAnalysis.py',
+                 'cumulative_moments.py', 'boundary_table.py',
+                 'gs_boundaries.py', 'lbl_store.py'],
+        'inputs': [_store_('LBL')],
+        'outputs': ['Outputs\\Results_Target1000_ttest.png']},
+    'gift_distribution': {
+        'code': ['gift_distribution.py', 'lbl_store.py'],
+        'inputs': [_store_('LBL')],
+        'outputs': ['Outputs\\Results_SpineHist.png',
+                    'Outputs\\Results_Boxplot.png']},
+    'guardrail_checks': {
+        'code': ['guardrail_checks.py', 'lbl_store.py'],
+        'inputs': [_store_('LBL')],
+        'outputs': ['AmendedData\\LBL_giftaid.csv',
+                    'AmendedData\\LBL_emailable.csv',
+                    _store_('LBL_giftaid'), _store_('LBL_emailable')]},
+    'income_projections': {
+        'code': ['income_projections.py', 'lbl_store.py'],
+        'inputs': [_store_('LBL'), _store_('LBL_emailable')],
+        'outputs': ['AmendedData\\IncomeProjections.csv']},
+    }
+
+
+def _files_(pattern):
+    """Files matching a declared path, which may be a (recursive) glob"""
+    return sorted(glob.glob(pattern.replace('\\', os.sep), recursive=True))
+
+
+def dependencies(stages):
+    """Map each stage to the stages that write one of its inputs"""
+    writers = {out: name for name, stage in stages.items()
+               for out in stage['outputs']}
+    return {name: sorted({writers[i] for i in stage['inputs']
+                          if i in writers and writers[i] != name})
+            for name, stage in stages.items()}
+
+
+def stage_hash(stage):
+    """Hash of a stage's code, inputs, and key; None if an input is missing"""
+    sha1 = hashlib.sha1()
+    for pattern in stage['code'] + stage['inputs']:
+        fps = _files_(pattern)
+        if len(fps) == 0:
+            return None
+        for fp in fps:
+            sha1.update(fp.encode())
+            if fp.endswith('.parquet'):
+                # store files are never rewritten, only added under new
+                # names, so the name and size stand in for the contents
+                sha1.update(str(os.path.getsize(fp)).encode())
+                continue
+            with open(fp, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha1.update(chunk)
+    if 'key' in stage:
+        sha1.update(stage['key']().encode())
+    return sha1.hexdigest()
+
+
+def run(stages=stages, state_fp='AmendedData\\pipeline_state.json',
+        force=(), workers=4):
+    """
+    Run the stages in dependency order, in parallel where possible.
+
+    Parameters
+    ----------
+    force : list
+        Stage names to run even if unchanged.
+    workers : int
+        Maximum number of scripts run at once.
+
+    Returns
+    -------
+    status : dict
+        Stage name to 'ran', 'skipped', 'missing inputs', 'failed', or
+        'blocked' (an upstream stage failed or was missing inputs).
+    """
+    state_fp = state_fp.replace('\\', os.sep)
+    state = {}
+    if os.path.exists(state_fp):
+        with open(state_fp) as f:
+            state = json.load(f)
+    deps = dependencies(stages)
+    status = {}
+    env = dict(os.environ, MPLBACKEND='Agg')  # no blocking plt.show()
+
+    def run_stage(name):
+        stage = stages[name]
+        digest = stage_hash(stage)
+        outputs_exist = all(len(_files_(o)) > 0 for o in stage['outputs'])
+        if digest is None:
+            # a stage that deletes its inputs is done until new ones arrive
+            if (stage.get('consumes_inputs') and outputs_exist and
+                    name in state):
+                return name, 'skipped', None
+            return name, 'missing inputs', None
+        if (name not in force and outputs_exist and
+                state.get(name) == digest):
+            return name, 'skipped', None
+        print("Running {}".format(name))
+        done = subprocess.run([sys.executable, stage['code'][0]], env=env)
+        if done.returncode != 0:
+            return name, 'failed', None
+        return name, 'ran', digest
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(stages):
+            ready = [n for n in stages if n not in status and
+                     all(d in status for d in deps[n])]
+            for name in ready:
+                if any(status[d] in ('failed', 'blocked', 'missing inputs')
+                       for d in deps[name]):
+                    status[name] = 'blocked'
+            ready = [n for n in ready if n not in status]
+            interactive = [n for n in ready if stages[n].get('interactive')]
+            batch = [n for n in ready if n not in interactive]
+            results = [run_stage(n) for n in interactive]
+            results += list(pool.map(run_stage, batch))
+            for name, result, digest in results:
+                status[name] = result
+                if digest is not None:
+                    state[name] = digest
+                print("{}: {}".format(name, result))
+    with open(state_fp, 'w') as f:
+        json.dump(state, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--force', nargs='*', default=[],
+                        help='stages to run even if unchanged')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    run(force=args.force, workers=args.workers)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Reconcile GA transaction IDs with the line-by-line (LBL) export.
+
+Both ID lists are hashed into one index once (pd.factorize), and every
+count comes from bincounts over the codes, so the whole check is linear in
+the number of IDs. Regular giving IDs ('IDD...') are reported separately:
+they are in GA but are dropped from the single giving LBL by lbl_munge.
+
+For multi-million row LBL histories, a Bloom filter of the (much smaller)
+set of GA IDs can first cut the LBL IDs down to likely matches, so only
+those are kept and joined. It saves memory rather than time: hashing the
+strings costs about as much as the exact join, so it pays off when LBL IDs
+are screened a chunk at a time as they're read, not once they're loaded.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and about error_rate false
+    positives, in ~1.2 bytes per item at 1%. Bits are kept packed in a
+    numpy uint8 array; IDs are hashed with pandas' vectorised hash_array.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.size = int(np.ceil(-capacity*np.log(error_rate) / np.log(2)**2))
+        self.num_hashes = max(1, int(round(self.size/capacity*np.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions_(self, ids):
+        """
+        Bit positions for each id, by double hashing with the two halves of
+        one 64 bit hash: h1 + i*h2
+        """
+        h = pd.util.hash_array(np.asarray(ids, dtype=object))
+        h1 = h & np.uint64(0xFFFFFFFF)
+        h2 = (h >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :]*h2[:, None]) % np.uint64(self.size)
+
+    def add(self, ids):
+        pos = self._positions_(ids).ravel()
+        np.bitwise_or.at(self.bits, pos >> np.uint64(3),
+                         (1 << (pos & np.uint64(7))).astype(np.uint8))
+
+    def contains(self, ids):
+        """Boolean array: True where the id may be in the set"""
+        pos = self._positions_(ids)
+        bit = (self.bits[pos >> np.uint64(3)] >> (pos & np.uint64(7))) & 1
+        return bit.astype(bool).all(axis=1)
+
+
+def _sample_(ids, sample_size):
+    return list(ids[:sample_size])
+
+
+def reconcile(ga_ids, lbl_ids, sample_size=10, prefilter=False):
+    """
+    Compare the GA and LBL transaction IDs.
+
+    Parameters
+    ----------
+    ga_ids, lbl_ids : list, pd.Index, np.array
+        Transaction IDs, e.g. the GADataTrans and sglbl id columns.
+    sample_size : int
+        Number of example IDs to keep for each category.
+    prefilter : bool
+        Drop LBL IDs that a Bloom filter says can't be in GA before the
+        exact comparison. Then 'lbl_only' and 'lbl_duplicates' only cover
+        the IDs that passed the filter, and 'lbl' counts rows, not unique
+        IDs.
+
+    Returns
+    -------
+    report : dict
+        'counts': number of IDs that are in GA, LBL, both ('matched'),
+        GA only (excluding regular giving), LBL only, duplicated in GA or
+        LBL, and regular giving in GA ('rg').
+        'samples': up to sample_size IDs for each of those lists.
+        'ok': True if every non-RG GA ID is in LBL and neither side has
+        duplicates.
+    """
+    ga_ids = np.asarray(ga_ids, dtype=object)
+    lbl_ids = np.asarray(lbl_ids, dtype=object)
+    num_lbl_rows = len(lbl_ids)
+    if prefilter:
+        bloom = BloomFilter(len(ga_ids))
+        bloom.add(ga_ids)
+        lbl_ids = lbl_ids[bloom.contains(lbl_ids)]
+    codes, uniques = pd.factorize(np.concatenate([ga_ids, lbl_ids]))
+    uniques = np.asarray(uniques, dtype=object)
+    in_ga = np.bincount(codes[:len(ga_ids)], minlength=len(uniques))
+    in_lbl = np.bincount(codes[len(ga_ids):], minlength=len(uniques))
+    is_rg = pd.Series(uniques).str.startswith('IDD').fillna(False).values
+    lists = {'matched': uniques[(in_ga > 0) & (in_lbl > 0)],
+             'ga_only': uniques[(in_ga > 0) & (in_lbl == 0) & ~is_rg],
+             'lbl_only': uniques[(in_ga == 0) & (in_lbl > 0)],
+             'ga_duplicates': uniques[in_ga > 1],
+             'lbl_duplicates': uniques[in_lbl > 1],
+             'rg': uniques[(in_ga > 0) & is_rg]}
+    counts = {'ga': int((in_ga > 0).sum()),
+              'lbl': num_lbl_rows if prefilter else int((in_lbl > 0).sum())}
+    counts.update({k: len(v) for k, v in lists.items()})
+    return {'counts': counts,
+            'samples': {k: _sample_(v, sample_size)
+                        for k, v in lists.items() if k != 'matched'},
+            'ok': (counts['ga_only'] + counts['ga_duplicates'] +
+                   counts['lbl_duplicates']) == 0}
+
+
+def print_report(report):
+    """Counts, and sample IDs for anything that needs a look"""
+    counts, samples = report['counts'], report['samples']
+    print("IDs in GA: {ga}, in LBL: {lbl}, in both: {matched}, regular "
+          "giving in GA: {rg}".format(**counts))
+    for key, msg in [('ga_only', "In GA but not LBL"),
+                     ('ga_duplicates', "Duplicated in GA"),
+                     ('lbl_duplicates', "Duplicated in LBL")]:
+        if counts[key]:
+            print("{}: {} e.g. {}".format(msg, counts[key], samples[key]))
+    print("In LBL but not the test (not in GA): {}".format(
+        counts['lbl_only']))
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(1)
+    lbl_ids = np.array(['ICC{:010d}'.format(i) for i in
+                        rng.choice(10**9, 3000000, replace=False)],
+                       dtype=object)
+    ga_ids = np.concatenate([rng.choice(lbl_ids, 200000, replace=False),
+                             ['IDD{}'.format(i) for i in range(500)],
+                             ['MISSING{}'.format(i) for i in range(20)]])
+    for prefilter in [False, True]:
+        tic = time.perf_counter()
+        report = reconcile(ga_ids, lbl_ids, prefilter=prefilter)
+        print("prefilter={}: {:.2f}s".format(prefilter,
+                                             time.perf_counter() - tic))
+        print_report(report)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Sample size planning for the sequential conversion % test.
+
+A sequential design needs more sample than a fixed one to reach the same
+power, by an inflation factor that depends only on the number of looks,
+alpha and beta. The factors, and the expected sample size under the null
+and the alternative (as fractions of the maximum), come from the exact
+crossing probabilities in gs_boundaries.py, with equally spaced looks and
+the exact group-sequential boundaries: those of SeqTTest and of
+SeqAnalysis.crossed(exact=True), not the nominal ones SeqAnalysis uses by
+default, which cross a little too easily. The table takes about 20s to
+build, so get_table builds it on first use and keeps it in TABLE_FP;
+planning a grid of scenarios is then a lookup.
+
+Tests are one-sided at alpha, as the SeqAnalysis efficacy boundary is.
+"""
+
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from scipy.optimize import brentq
+from scipy.stats import norm
+
+from gs_boundaries import crossing_probs, exact_boundaries
+
+TABLE_FP = 'AmendedData\\InflationTable.npz'
+VERSION = 1
+LOOKS = np.arange(1, 31)
+ALPHAS = np.array([0.01, 0.025, 0.05, 0.1])
+BETAS = np.array([0.1, 0.2])
+
+
+def design(num_looks, alpha=0.05, beta=0.2):
+    """
+    Inflation factor and expected sample size of the sequential design.
+
+    Returns
+    -------
+    res : dict
+        'inflation': maximum sample / fixed design sample for the same
+        power. 'ess_h0', 'ess_h1': expected sample / maximum sample, under
+        no effect and under the effect the design is powered for.
+    """
+    info_q = np.arange(1, num_looks + 1) / num_looks
+    upper, lower = exact_boundaries(info_q, alpha, beta)
+
+    def power(drift):
+        return crossing_probs(info_q, upper, lower, drift)[0].sum()
+    drift_fixed = norm.isf(alpha) + norm.isf(beta)
+    drift = brentq(lambda d: power(d) - (1 - beta), 0, 3*drift_fixed,
+                   xtol=1e-8)
+
+    def ess(drift):
+        p_up, p_low = crossing_probs(info_q, upper, lower, drift)
+        stop = (p_up + p_low)[:-1]
+        return stop @ info_q[:-1] + (1 - stop.sum())
+    return {'inflation': (drift / drift_fixed)**2, 'ess_h0': ess(0.0),
+            'ess_h1': ess(drift)}
+
+
+class InflationTable:
+    """
+    design() for every number of looks, alpha and beta on the grid.
+
+    Attributes
+    ----------
+    values: np.array
+        Shape (looks, alphas, betas, 3): inflation, ess_h0, ess_h1.
+    """
+    fields = ['inflation', 'ess_h0', 'ess_h1']
+
+    def __init__(self, looks=LOOKS, alphas=ALPHAS, betas=BETAS, values=None):
+        self.looks, self.alphas, self.betas = looks, alphas, betas
+        if values is None:
+            values = np.empty((len(looks), len(alphas), len(betas), 3))
+            for (i, k), (j, a), (m, b) in itertools.product(
+                    enumerate(looks), enumerate(alphas), enumerate(betas)):
+                res = design(k, a, b)
+                values[i, j, m] = [res[f] for f in self.fields]
+        self.values = values
+
+    def lookup(self, num_looks, alpha, beta):
+        """design() from the table, or solved directly if off the grid"""
+        i = np.flatnonzero(self.looks == num_looks)
+        j = np.flatnonzero(np.isclose(self.alphas, alpha))
+        m = np.flatnonzero(np.isclose(self.betas, beta))
+        if len(i) and len(j) and len(m):
+            return dict(zip(self.fields, self.values[i[0], j[0], m[0]]))
+        return design(num_looks, alpha, beta)
+
+    def save(self, fp=TABLE_FP):
+        np.savez(fp, version=VERSION, looks=self.looks, alphas=self.alphas,
+                 betas=self.betas, values=self.values)
+
+    @classmethod
+    def load(cls, fp=TABLE_FP):
+        with np.load(fp) as arrays:
+            if int(arrays['version']) != VERSION:
+                raise ValueError("Stale inflation table at {}".format(fp))
+            return cls(arrays['looks'], arrays['alphas'], arrays['betas'],
+                       arrays['values'])
+
+
+_table_ = None
+
+
+def get_table(fp=TABLE_FP):
+    """The inflation table, loaded from fp or built and saved on first use"""
+    global _table_
+    if _table_ is None:
+        try:
+            _table_ = InflationTable.load(fp)
+        except (OSError, ValueError, KeyError):
+            _table_ = InflationTable()
+            if os.path.isdir(os.path.dirname(fp) or '.'):
+                _table_.save(fp)
+    return _table_
+
+
+def fixed_n(p_ctrl, uplift, alpha=0.05, beta=0.2):
+    """
+    Users per cell for a fixed, one-sided two-proportion z-test.
+
+    Parameters
+    ----------
+    p_ctrl : float, np.array
+        Control conversion rate.
+    uplift : float, np.array
+        Relative uplift to detect, e.g. 0.1 for +10%.
+    """
+    p1 = np.asarray(p_ctrl, dtype=float)
+    p2 = p1 * (1 + np.asarray(uplift, dtype=float))
+    p_bar = (p1 + p2) / 2
+    num = (norm.isf(alpha)*np.sqrt(2*p_bar*(1-p_bar)) +
+           norm.isf(beta)*np.sqrt(p1*(1-p1) + p2*(1-p2)))
+    return num**2 / (p2 - p1)**2
+
+
+def plan(p_ctrl, uplift, alpha=0.05, beta=0.2, looks=30):
+    """
+    Maximum and expected sample size of the sequential design, for every
+    combination of the inputs (each a value or a list).
+
+    Returns
+    -------
+    res : pd.DataFrame
+        One row per scenario: the inputs, fixed design users per cell,
+        inflation factor, maximum users per cell, the SeqAnalysis target
+        (conversions over both cells at the maximum), and expected users
+        per cell under the null and the alternative.
+    """
+    table = get_table()
+    rows = []
+    for p, u, a, b, k in itertools.product(
+            *[np.atleast_1d(x) for x in (p_ctrl, uplift, alpha, beta,
+                                         looks)]):
+        res = table.lookup(k, a, b)
+        n_fixed = fixed_n(p, u, a, b)
+        n_max = res['inflation'] * n_fixed
+        rows.append({'p_ctrl': p, 'uplift': u, 'alpha': a, 'beta': b,
+                     'looks': k, 'n_fixed': n_fixed,
+                     'inflation': res['inflation'], 'n_max': n_max,
+                     'target': int(np.ceil(n_max * p * (2 + u))),
+                     'ess_h0': res['ess_h0'] * n_max,
+                     'ess_h1': res['ess_h1'] * n_max})
+    return pd.DataFrame(rows)
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    tic = time.perf_counter()
+    get_table()
+    print("Loaded/built inflation table in {:.1f}s".format(
+        time.perf_counter() - tic))
+    tic = time.perf_counter()
+    res = plan(np.linspace(0.1, 0.3, 11), np.linspace(0.05, 0.3, 11),
+               [0.025, 0.05], [0.1, 0.2], [5, 10, 30])
+    print("{} scenarios in {:.2f}s".format(len(res),
+                                          time.perf_counter() - tic))
+    print(plan(0.214, 0.1).T)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Permutation version of the sequential average gift check.
+
+The t-test is sensitive to heavy tails, which is why the gifts are trimmed
+at £100. A permutation test needs no such assumption, so it can use every
+gift. Under the null the cell labels are exchangeable within each day, so
+each replicate shuffles the labels within each day's gifts, keeping the
+daily count per cell. One replicate then gives the whole path of
+cumulative mean differences, reused at every look. The p-value at each
+look is compared with the nominal level the spending function allows
+there: the p-value of the SeqAnalysis boundary.
+
+Replicates are drawn in batches, as arrays of shape (replicates, gifts in
+the day), and batches can be spread over a process pool. Each batch has its
+own seed spawned from one SeedSequence, so the result doesn't depend on
+the number of workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+def _day_blocks_(lbl, cells):
+    """Gift values and test flags sorted by day, with day boundaries"""
+    lbl = lbl[lbl['cell'].isin(cells)].sort_values('date')
+    day = pd.DatetimeIndex(lbl['date']).normalize()
+    days, day_idx = np.unique(day.values, return_inverse=True)
+    bounds = np.searchsorted(day_idx, np.arange(len(days) + 1))
+    values = lbl['value'].to_numpy(dtype=float)
+    is_test = (lbl['cell'] == cells[1]).to_numpy(dtype=float)
+    return pd.DatetimeIndex(days), values, is_test, bounds
+
+
+def _mean_diff_(test_sum, total_sum, n_test, n_ctrl):
+    """Cumulative test - ctrl mean, from cumulative test and total sums"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return test_sum/n_test - (total_sum - test_sum)/n_ctrl
+
+
+def _perm_batch_(values, is_test, bounds, fixed, seed, size):
+    """
+    Counts of replicates at or above, and at or below, the observed
+    difference at each look.
+    """
+    rng = np.random.default_rng(seed)
+    num_days = len(bounds) - 1
+    test_sum = np.empty((size, num_days))
+    for d in range(num_days):
+        lo, hi = bounds[d], bounds[d+1]
+        labels = np.tile(is_test[lo:hi], (size, 1))
+        rng.permuted(labels, axis=1, out=labels)
+        test_sum[:, d] = labels @ values[lo:hi]
+    diff = _mean_diff_(test_sum.cumsum(axis=1), fixed['total_sum'],
+                       fixed['n_test'], fixed['n_ctrl'])
+    tol = 1e-9 * np.maximum(1, np.abs(fixed['obs']))
+    return ((diff >= fixed['obs'] - tol).sum(axis=0),
+            (diff <= fixed['obs'] + tol).sum(axis=0))
+
+
+def permutation_test(lbl, target, cells=('ctrl', 'test'), alpha=0.05,
+                     beta=0.2, replicates=10000, batch_size=250, workers=1,
+                     seed=1234, exact=False):
+    """
+    Sequential within-day permutation test of the average gift, at every
+    day with gifts.
+
+    Parameters
+    ----------
+    lbl : pd.DataFrame
+        Per-gift data with date, cell and value columns, e.g. LBL.csv.
+        Not trimmed.
+    target : int
+        Target number of gifts, for the information quotient.
+    cells : list
+        Control and test cell names.
+    alpha, beta : float
+        Spending function parameters, as in SeqAnalysis.
+    replicates : int
+        Number of permutations. The smallest possible p-value is
+        1/(replicates+1), so early looks, where the spending function
+        allows far less, can't cross the efficacy boundary.
+    workers : int
+        Processes to spread the batches over.
+    exact : bool
+        Use exact group-sequential boundaries at these looks (see
+        gs_boundaries.py) for the nominal levels.
+
+    Returns
+    -------
+    looks : pd.DataFrame
+        By day: gifts n, q, the test - ctrl difference in mean gift, the
+        upper and lower tail permutation p-values, the nominal stop and
+        futility levels, and the decision ('efficacy', 'futility' or
+        'continue').
+    """
+    cells = list(cells)
+    days, values, is_test, bounds = _day_blocks_(lbl, cells)
+    n_test = np.add.reduceat(is_test, bounds[:-1]).cumsum()
+    n = np.diff(bounds).cumsum()
+    total_sum = np.add.reduceat(values, bounds[:-1]).cumsum()
+    test_sum = np.add.reduceat(values * is_test, bounds[:-1]).cumsum()
+    fixed = {'n_test': n_test, 'n_ctrl': n - n_test, 'total_sum': total_sum}
+    fixed['obs'] = _mean_diff_(test_sum, total_sum, n_test, n - n_test)
+
+    sizes = [batch_size] * (replicates // batch_size)
+    if replicates % batch_size:
+        sizes.append(replicates % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    func = partial(_perm_batch_, values, is_test, bounds, fixed)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = list(pool.map(func, seeds, sizes))
+    else:
+        counts = list(map(func, seeds, sizes))
+    upper = sum(c[0] for c in counts)
+    lower = sum(c[1] for c in counts)
+
+    looks = pd.DataFrame({'n': n, 'q': n / target, 'diff': fixed['obs']},
+                         index=days)
+    valid = (fixed['n_test'] > 0) & (fixed['n_ctrl'] > 0)
+    looks['p_upper'] = np.where(valid, (upper + 1) / (replicates + 1),
+                                np.nan)
+    looks['p_lower'] = np.where(valid, (lower + 1) / (replicates + 1),
+                                np.nan)
+    if exact:
+        from gs_boundaries import exact_boundaries
+        stop_z, futil_z = exact_boundaries(looks['q'].values, alpha, beta)
+    else:
+        from boundary_table import z_boundary
+        # capped at q = 1, as gs_boundaries.spending is: past the target
+        # there's no more alpha to spend
+        capped_q = np.minimum(looks['q'].values, 1)
+        stop_z = z_boundary(capped_q, alpha)
+        futil_z = -z_boundary(capped_q, beta)
+    looks['stop_p'] = norm.sf(stop_z)
+    looks['futility_p'] = norm.cdf(futil_z)
+    looks['decision'] = np.select(
+        [looks['p_upper'] < looks['stop_p'],
+         looks['p_lower'] < looks['futility_p']],
+        ['efficacy', 'futility'], 'continue')
+    return looks
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(1)
+    num_gifts, num_days = 30000, 30
+    lbl = pd.DataFrame({
+        'date': pd.Timestamp('2020-05-20') + pd.to_timedelta(
+            rng.integers(0, num_days*24*60, num_gifts), unit='min'),
+        'cell': rng.choice(['ctrl', 'test'], num_gifts),
+        'value': rng.lognormal(3, 1, num_gifts)})  # heavy right tail
+    lbl.loc[lbl['cell'] == 'test', 'value'] *= 1.05
+    for workers in [1, 4]:
+        tic = time.perf_counter()
+        looks = permutation_test(lbl, target=30000, workers=workers)
+        print("{} gifts x {} looks x 10k replicates, {} workers: "
+              "{:.1f}s".format(num_gifts, num_days, workers,
+                               time.perf_counter() - tic))
+    print(looks.tail(3))
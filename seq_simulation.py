@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo check of the error rates of the spending boundaries.
+
+Simulates many cumulative split tests as trial x look arrays, applies the
+same boundaries as SeqAnalysis (conversion %) and SeqTTest (average gift),
+and reports how often each boundary is crossed first and the expected
+sample size at stopping. Run under the null (equal cells) for the type-I
+error, and under the expected uplift for the power.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+
+from boundary_table import get_table
+from gs_boundaries import exact_boundaries
+
+looks = np.linspace(0.06, 1, 30)  # as in SeqAnalysis and the t-test script
+
+
+def _first_crossing_(stat, stop, futility):
+    """Sums of the outcomes of each trial, stopping at the first crossing"""
+    eff, fut = stat > np.abs(stop), stat < futility
+    crossed = eff | fut
+    any_crossed = crossed.any(axis=1)
+    first = np.where(any_crossed, crossed.argmax(axis=1), stat.shape[1] - 1)
+    rows = np.arange(stat.shape[0])
+    return first, {'efficacy': int((any_crossed & eff[rows, first]).sum()),
+                   'futility': int((any_crossed & ~eff[rows, first]).sum()),
+                   'trials': stat.shape[0]}
+
+
+def _boundaries_(q, alpha, beta, exact, planned):
+    """Nominal boundaries at the observed q, or exact ones at planned q"""
+    if exact:
+        upper, lower = exact_boundaries(planned, alpha, beta)
+        return upper[None, :], lower[None, :]
+    table = get_table()
+    return table.z_boundary(q, alpha), -table.z_boundary(q, beta)
+
+
+def conversion_chunk(seed, num_trials, target, p_ctrl, p_test, alpha=0.05,
+                     beta=0.2, looks=looks, exact=False):
+    """
+    Simulate num_trials two-cell conversion tests, checked at each look.
+
+    Each cell gets the same number of users, so that the expected number of
+    conversions at look k is looks[k] * target.
+
+    Returns
+    -------
+    res : dict
+        Counts of trials stopped for efficacy and futility, the number of
+        trials, and the summed users per cell and q at stopping.
+    """
+    rng = np.random.default_rng(seed)
+    n = np.round(looks * target / (p_ctrl + p_test)).astype(np.int64)
+    new_n = np.diff(n, prepend=0)
+    conv = [rng.binomial(new_n, p, size=(num_trials, len(n))).cumsum(axis=1)
+            for p in (p_ctrl, p_test)]
+    ctr = [c / n for c in conv]
+    var = [r*(1-r)/n for r in ctr]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (ctr[1] - ctr[0]) / np.sqrt(var[0] + var[1])
+    q = (conv[0] + conv[1]) / target
+    stop, futility = _boundaries_(q, alpha, beta, exact, looks)
+    first, res = _first_crossing_(z, stop, futility)
+    res['n'] = float(n[first].sum())
+    res['q'] = float(q[np.arange(num_trials), first].sum())
+    return res
+
+
+def gift_chunk(seed, num_trials, target, prompts, p_ctrl, p_test,
+               alpha=0.05, beta=0.2, looks=looks, exact=False):
+    """
+    Simulate num_trials two-cell average gift tests, checked at each look.
+
+    Gifts are drawn as counts per prompt value (multinomial), so means and
+    variances come from the counts. As in SeqTTest, q is gifts over target
+    and the t-boundaries use each look's Welch-Satterthwaite degrees of
+    freedom.
+
+    Returns
+    -------
+    res : dict
+        As conversion_chunk, with n the gifts per cell at stopping.
+    """
+    rng = np.random.default_rng(seed)
+    prompts = np.asarray(prompts, dtype=float)
+    n = np.round(looks * target / 2).astype(np.int64)
+    new_n = np.diff(n, prepend=0)
+    stats, se2 = [], []
+    for p in (p_ctrl, p_test):
+        counts = rng.multinomial(new_n[None, :], p,
+                                 size=(num_trials, len(n))).cumsum(axis=1)
+        total = counts @ prompts
+        mean = total / n
+        var = (counts @ prompts**2 - n*mean**2) / (n - 1)
+        stats.append((mean, var))
+        se2.append(var / n)
+    t_stat = (stats[1][0] - stats[0][0]) / np.sqrt(se2[0] + se2[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        degf = (se2[0] + se2[1])**2 / ((se2[0]**2 + se2[1]**2) / (n - 1))
+    q = np.broadcast_to(2*n / target, t_stat.shape)
+    stop, futility = _boundaries_(q, alpha, beta, exact, looks)
+    table = get_table()
+    stop = table.t_from_z(stop, degf)
+    futility = table.t_from_z(futility, degf)
+    first, res = _first_crossing_(t_stat, stop, futility)
+    res['n'] = float(n[first].sum())
+    res['q'] = float(q[np.arange(num_trials), first].sum())
+    return res
+
+
+def simulate(chunk_func, num_trials, chunk_size=50000, workers=1, seed=1234,
+             **kwargs):
+    """
+    Run chunk_func over num_trials, in chunks, optionally in a process pool.
+
+    Each chunk gets its own seed spawned from seed, so the result depends
+    only on seed and chunk_size, not on the number of workers.
+
+    Parameters
+    ----------
+    chunk_func : function
+        conversion_chunk or gift_chunk.
+    kwargs
+        Passed on to chunk_func (target, p_ctrl, p_test, ...).
+
+    Returns
+    -------
+    res : dict
+        Rates of stopping for efficacy and futility, of reaching the last
+        look undecided, and the expected n and q at stopping.
+    """
+    sizes = [chunk_size] * (num_trials // chunk_size)
+    if num_trials % chunk_size:
+        sizes.append(num_trials % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    func = partial(_call_chunk_, chunk_func, kwargs)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(func, seeds, sizes))
+    else:
+        chunks = list(map(func, seeds, sizes))
+    tot = {k: sum(c[k] for c in chunks) for k in chunks[0]}
+    trials = tot['trials']
+    return {'efficacy': tot['efficacy'] / trials,
+            'futility': tot['futility'] / trials,
+            'undecided': 1 - (tot['efficacy'] + tot['futility']) / trials,
+            'expected_n': tot['n'] / trials,
+            'expected_q': tot['q'] / trials,
+            'trials': trials}
+
+
+def _call_chunk_(chunk_func, kwargs, seed, size):
+    return chunk_func(seed, size, **kwargs)
+
+
+# Benchmark
+if __name__ == "__main__":
+    import time
+    get_table()  # build/save once before the workers load it
+    for name, p_test in [('H0', 0.214), ('H1 +10%', 0.214*1.1)]:
+        tic = time.perf_counter()
+        res = simulate(conversion_chunk, 1000000, workers=4, target=1000,
+                       p_ctrl=0.214, p_test=p_test)
+        print("conversion {}: {} ({:.1f}s)".format(
+            name, {k: round(v, 4) for k, v in res.items()},
+            time.perf_counter() - tic))
+    prompts, p_ctrl = [5, 25, 50], [0.25, 0.375, 0.375]
+    for name, p_test in [('H0', p_ctrl), ('H1', [0.2, 0.375, 0.425])]:
+        tic = time.perf_counter()
+        res = simulate(gift_chunk, 200000, workers=4, target=1000,
+                       prompts=prompts, p_ctrl=p_ctrl, p_test=p_test)
+        print("gift {}: {} ({:.1f}s)".format(
+            name, {k: round(v, 4) for k, v in res.items()},
+            time.perf_counter() - tic))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Ingest the lower-sampling transaction ID workbook (one sheet per day) in a
+single pass, caching the parsed rows as parquet.
+"""
+
+import hashlib
+import json
+import os
+import openpyxl
+import pandas as pd
+
+trans_cols = {'Transaction ID': 'id', 'Experiment ID with Variant': 'cell',
+              'Unique Purchases': 'count'}
+
+
+def _file_hash_(fp, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(fp, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _parse_sheet_(ws, header_row):
+    """Rows of one day sheet, from the 'Results Breakdown' header down"""
+    rows = ws.iter_rows(min_row=header_row, values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return []
+    idx = [list(header).index(col) for col in trans_cols]
+    out = []
+    for row in rows:
+        if len(row) == 0 or row[0] is None:
+            break
+        out.append([row[i] for i in idx] + [ws.title])
+    return out
+
+
+def read_trans_sheets(fp, cache_fp='AmendedData\\TransIDSheets.parquet',
+                      header_row=15, sheet_prefix='IDs'):
+    """
+    Read every day sheet of the transaction ID workbook.
+
+    The workbook is opened once, read-only, and only sheets not already in
+    the cache are parsed (day sheets don't change once the add-on has run
+    them). The cache is keyed on the workbook's mtime and hash, so an
+    untouched workbook is not opened at all.
+
+    Parameters
+    ----------
+    fp : string
+        Path of the .xlsx export.
+    cache_fp : string
+        Parquet file of parsed rows. A .json manifest sits alongside it.
+    header_row : int
+        1-based row of the 'Transaction ID' header on each sheet.
+    sheet_prefix : string
+        Day sheets are the ones whose name starts with this.
+
+    Returns
+    -------
+    trans : pd.DataFrame
+        Columns id, cell, count, sheet.
+    """
+    manifest_fp = os.path.splitext(cache_fp)[0] + '.json'
+    mtime = os.path.getmtime(fp)
+    manifest = {'mtime': None, 'sha1': None, 'sheets': []}
+    cached = None
+    if os.path.exists(manifest_fp) and os.path.exists(cache_fp):
+        with open(manifest_fp) as f:
+            manifest = json.load(f)
+        cached = pd.read_parquet(cache_fp)
+        if manifest['mtime'] == mtime:
+            return cached
+    sha1 = _file_hash_(fp)
+    if cached is not None and manifest['sha1'] == sha1:
+        new_sheets = []
+    else:
+        wb = openpyxl.load_workbook(fp, read_only=True)
+        new_sheets = [name for name in wb.sheetnames
+                      if name.startswith(sheet_prefix) and
+                      name not in manifest['sheets']]
+        rows = []
+        for name in new_sheets:
+            rows += _parse_sheet_(wb[name], header_row)
+        wb.close()
+        new = pd.DataFrame(rows, columns=list(trans_cols.values()) +
+                           ['sheet'])
+        new['count'] = pd.to_numeric(new['count'])
+        cached = new if cached is None else pd.concat([cached, new],
+                                                      ignore_index=True)
+        cached.to_parquet(cache_fp, index=False)
+        print("Parsed {} new sheets, {} rows".format(len(new_sheets),
+                                                     len(new)))
+    manifest = {'mtime': mtime, 'sha1': sha1,
+                'sheets': manifest['sheets'] + new_sheets}
+    with open(manifest_fp, 'w') as f:
+        json.dump(manifest, f)
+    return cached
@@ -6,8 +6,11 @@ Created on Fri May 15 13:45:34 2020
 """
 
 import numpy as np
+import pandas as pd
 from scipy.stats import ttest_ind_from_stats
 
+from mde import mde, power_curves
+
 params = {'prompts': [5, 25, 50],
           'p': [0.35, 0.35, 0.3],
           'vol': 1000}
@@ -17,21 +20,19 @@ params['vals'] = np.random.choice(params['prompts'], size=params['vol'],
 params['mean'] = params['vals'].mean()
 params['std'] = params['vals'].std()
 
-p_MDE = 1
-t_MDE = 0
-expected_liftMDE = 1.01
-while p_MDE > 0.05:
-    t_MDE, p_MDE = ttest_ind_from_stats(
-            params['mean'],
-            params['std'],
-            params['vol'],
-            params['mean']*expected_liftMDE,
-            params['std'],
-            params['vol']
-            )
-    if p_MDE < 0.05:
-        break
-    expected_liftMDE += 0.01
+# Smallest lift detected with 80% power (the old 1% step loop stopped where
+# the expected p first fell below alpha, i.e. about 50% power)
+alpha, pwr = 0.05, 0.8
+expected_liftMDE = 1 + mde(params['mean'], params['std'], params['vol'],
+                           alpha, pwr)
+t_MDE, p_MDE = ttest_ind_from_stats(
+        params['mean'],
+        params['std'],
+        params['vol'],
+        params['mean']*expected_liftMDE,
+        params['std'],
+        params['vol']
+        )
 
 print(t_MDE, p_MDE, expected_liftMDE)
 
@@ -48,4 +49,10 @@ print("Ctrl: (mean={:.2f}, std={:.2f})".format(
               degf,
               t_MDE,
               p_MDE,
-              upliftMDE))
\ No newline at end of file
+              upliftMDE))
+
+# Power by lift and volume per cell, at this std
+lifts = np.arange(0, 0.31, 0.05)
+vols = [250, 500, 1000, 2000]
+curves = power_curves(lifts, vols, [params['std']], params['mean'], alpha)
+print(pd.DataFrame(curves[:, :, 0], index=lifts, columns=vols).round(2))
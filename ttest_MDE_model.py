@@ -6,10 +6,12 @@ Created on Fri May 15 16:07:28 2020
 """
 
 import numpy as np
-from scipy.stats import ttest_ind_from_stats
+import pandas as pd
 import matplotlib.pyplot as plt; plt.style.use('ggplot')
 import seaborn as sns
 
+from mde_simulation import empirical_mde, shifted_p, simulate_power
+
 np.random.seed(1234)
 
 # Set parameters
@@ -43,47 +45,29 @@ sns.violinplot(x=params['test']['vals'], color='#ee2a24', ax=axs[0])
 alpha = 0.7
 plt.setp(axs[0].collections, alpha=alpha)
 
-# MDE calc
-p_MDE = 1
-t_MDE = 0
-lift_MDE = 0.00
-while p_MDE > 0.05:
-    # Apply expected uplift - flatten the diff between prompts
-    lift = np.array([-lift_MDE, 0.5*lift_MDE, 0.5*lift_MDE])
-    params['test']['p'] = np.array(params['test']['p']) + lift
-    for cell in params.keys():
-        params[cell]['vals'] = np.random.choice(params[cell]['prompts'],
-                                                size=cellvol,
-                                                p=params[cell]['p'])
-        params[cell]['mean'] = params[cell]['vals'].mean()
-        params[cell]['std'] = params[cell]['vals'].std()
-    # t-test
-    t_MDE, p_MDE = ttest_ind_from_stats(
-            params['ctrl']['mean'],
-            params['ctrl']['std'],
-            cellvol,
-            params['test']['mean'],
-            params['test']['std'],
-            cellvol
-            )
-    degf = cellvol*2 - 2
-    upliftMDE = lift_MDE*100
-    print("Ctrl: (mean={:.2f}, std={:.2f})".format(
-              params['ctrl']['mean'],
-              params['ctrl']['std']),
-      "\nTest: (mean={:.2f}, std={:.2f})".format(
-              params['test']['mean'],
-              params['test']['std']),
-      "\nt({:.0f})={:.2f}, p={:.2f}, uplift={:,.0f}%\n".format(
-              degf,
-              t_MDE,
-              p_MDE,
-              upliftMDE))
-    if p_MDE < 0.05:
-        break
-    lift_MDE += 0.01
+# MDE calc - simulated power over a grid of lifts, in one pass
+# Apply expected uplift - flatten the diff between prompts
+lifts = np.arange(0, 0.21, 0.01)
+vols = [250, cellvol, 1000, 2000]
+test_p = shifted_p(params['test']['p'], lifts, shift=[-1, 0.5, 0.5])
+res = simulate_power(params['ctrl']['prompts'], params['ctrl']['p'], test_p,
+                     vols, replicates=5000,
+                     test_prompts=params['test']['prompts'])
+power = pd.DataFrame(res['power'], index=lifts.round(2), columns=vols)
+print(power.round(2))
+mdes = empirical_mde(lifts, res['power'], target=0.8)
+lift_MDE = mdes[vols.index(cellvol)]
+print("Prompt shift detected with 80% power: {:,.1f}% at {} gifts per cell "
+      "({:,.1f}% on the average gift)".format(
+          lift_MDE*100, cellvol,
+          np.interp(lift_MDE, lifts, res['mean_lift'])*100))
 
-# PLot resulting dist
+# Plot resulting dist
+params['test']['p'] = shifted_p(params['test']['p'], [lift_MDE])[0]
+for cell in params.keys():
+    params[cell]['vals'] = np.random.choice(params[cell]['prompts'],
+                                            size=cellvol,
+                                            p=params[cell]['p'])
 sns.violinplot(x=params['ctrl']['vals'], color='#1d1a1c', ax=axs[1])
 sns.violinplot(x=params['test']['vals'], color='#ee2a24', ax=axs[1])
-plt.setp(axs[1].collections, alpha=alpha)
\ No newline at end of file
+plt.setp(axs[1].collections, alpha=alpha)